@@ -0,0 +1,81 @@
+"""
+Autocomplete Benchmark
+
+Measures the latency of completing Product names from the in-process name
+index, for prefixes and for prefixes with a typo. No database is needed.
+
+Usage:
+    python benchmarks/bench_autocomplete.py [names]
+"""
+
+import os
+import random
+import sys
+import time
+from statistics import quantiles
+
+# Allow running the script from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# pylint: disable=wrong-import-position
+from service.common.name_index import NameIndex  # noqa: E402
+
+NAMES = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+LOOKUPS = 2_000
+LIMIT = 10
+VOCABULARY = 5_000
+SYLLABLES = [
+    consonant + vowel for consonant in "bcdfghjklmnprstvwz" for vowel in "aeiou"
+]
+
+
+def make_words(rng) -> list:
+    """Returns a vocabulary of made up words of two to four syllables"""
+    return [
+        "".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(VOCABULARY)
+    ]
+
+
+def make_name(rng, words) -> str:
+    """Returns a random product name of two to four words"""
+    return " ".join(rng.choices(words, k=rng.randint(2, 4)))
+
+
+def with_typo(rng, text: str) -> str:
+    """Returns the text with two neighbouring letters swapped"""
+    position = rng.randrange(len(text) - 1)
+    letters = list(text)
+    letters[position], letters[position + 1] = letters[position + 1], letters[position]
+    return "".join(letters)
+
+
+def time_lookups(index, queries) -> tuple:
+    """Returns the p50 and p99 latency of the queries in milliseconds"""
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        index.complete(query, LIMIT)
+        timings.append((time.perf_counter() - start) * 1000)
+    cuts = quantiles(timings, n=100)
+    return cuts[49], cuts[98]
+
+
+def main():
+    """Loads the index, then times prefix and typo lookups"""
+    rng = random.Random(42)
+    words = make_words(rng)
+    index = NameIndex()
+    index.enabled = True
+    start = time.perf_counter()
+    index.load((n, make_name(rng, words)) for n in range(NAMES))
+    print(f"Loaded {NAMES:,} names in {time.perf_counter() - start:.2f} s")
+
+    names = [make_name(rng, words) for _ in range(LOOKUPS)]
+    prefixes = [name[: rng.randint(2, 12)] for name in names]
+    typos = [with_typo(rng, name[:8]) for name in names]
+    for label, queries in (("prefix", prefixes), ("typo", typos)):
+        p50, p99 = time_lookups(index, queries)
+        print(f"{label:<8} p50 {p50:8.3f} ms   p99 {p99:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
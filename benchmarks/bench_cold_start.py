@@ -0,0 +1,111 @@
+"""
+Cold Start Benchmark
+
+Reports where the import time of the service goes, by top-level package,
+then measures how long a fresh process takes to build the app and how long
+gunicorn takes to answer its first /health, with the tables created on boot
+(DB_AUTO_CREATE=true) and without (DB_AUTO_CREATE=false, as deployed). A
+PostgreSQL database is required.
+
+Usage:
+    DATABASE_URI=postgresql+psycopg://... python benchmarks/bench_cold_start.py [runs]
+"""
+
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+from statistics import median
+import httpx2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+TOP = 12
+PORT = 8092
+BOOT = "import time; start = time.perf_counter(); import wsgi; print(time.perf_counter() - start)"
+
+
+def environment(auto_create: bool) -> dict:
+    """Returns the environment of a service process"""
+    return {
+        **os.environ,
+        "DB_AUTO_CREATE": str(auto_create).lower(),
+        "GUNICORN_WORKERS": "1",
+    }
+
+
+def import_breakdown() -> Counter:
+    """Returns the microseconds spent importing each top-level package"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import wsgi"],
+        cwd=ROOT,
+        env=environment(False),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    packages = Counter()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, _cumulative, name = line.split(":", 1)[1].split("|")
+        packages[name.strip().split(".")[0]] += int(own)
+    return packages
+
+
+def time_create_app(auto_create: bool) -> float:
+    """Returns the seconds a fresh interpreter takes to import wsgi"""
+    result = subprocess.run(
+        [sys.executable, "-c", BOOT],
+        cwd=ROOT,
+        env=environment(auto_create),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.split()[-1])
+
+
+def time_gunicorn(auto_create: bool) -> float:
+    """Returns the seconds from starting gunicorn to its first /health"""
+    start = time.perf_counter()
+    with subprocess.Popen(
+        ["gunicorn", "--bind", f"127.0.0.1:{PORT}", "wsgi:app"],
+        cwd=ROOT,
+        env=environment(auto_create),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    ) as server:
+        try:
+            while time.perf_counter() - start < 60:
+                try:
+                    httpx2.get(f"http://127.0.0.1:{PORT}/health", timeout=1)
+                    return time.perf_counter() - start
+                except httpx2.TransportError:
+                    time.sleep(0.01)
+            raise RuntimeError("gunicorn did not answer within 60 seconds")
+        finally:
+            server.terminate()
+
+
+def main():
+    """Prints the import breakdown and the cold start timings"""
+    packages = import_breakdown()
+    total = sum(packages.values())
+    print(f"Import time of wsgi: {total / 1000:.0f} ms")
+    for name, own in packages.most_common(TOP):
+        print(f"  {name:<24}{own / 1000:>8.1f} ms{own / total:>8.0%}")
+
+    print(f"\n{'DB_AUTO_CREATE':<16}{'create_app':>14}{'gunicorn ready':>18}")
+    for auto_create in (True, False):
+        create_app = median(time_create_app(auto_create) for _ in range(RUNS))
+        ready = median(time_gunicorn(auto_create) for _ in range(RUNS))
+        print(
+            f"{str(auto_create).lower():<16}{create_app * 1000:>11.0f} ms"
+            f"{ready * 1000:>15.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
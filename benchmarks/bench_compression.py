@@ -0,0 +1,76 @@
+"""
+Compression Benchmark
+
+Compares the bytes on the wire against the CPU time of compressing a
+product listing with every algorithm and a few levels of each. The
+listing is made up, so no database is needed.
+
+Usage:
+    python benchmarks/bench_compression.py [products]
+"""
+
+import os
+import random
+import sys
+import time
+from statistics import median
+
+# Allow running the script from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# pylint: disable=wrong-import-position
+from service.common import fast_json  # noqa: E402
+from service.common.compression import COMPRESSORS  # noqa: E402
+
+PRODUCTS = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+RUNS = 5
+LEVELS = {"gzip": (1, 6, 9), "br": (1, 4, 6, 11), "zstd": (1, 3, 9, 19)}
+WORDS = "red blue steel copper mug kettle plate large small travel cup bowl".split()
+
+
+def make_listing(rng) -> bytes:
+    """Returns a JSON listing of made up products"""
+    documents = [
+        {
+            "_id": None,
+            "id": n,
+            "name": " ".join(rng.choices(WORDS, k=3)),
+            "description": " ".join(rng.choices(WORDS, k=rng.randint(5, 30))),
+            "available": rng.random() < 0.5,
+            "price": round(rng.uniform(1, 500), 2),
+            "image_url": f"https://images.example.com/products/{n}.png",
+        }
+        for n in range(PRODUCTS)
+    ]
+    return fast_json.encode(documents)
+
+
+def time_compression(encoding: str, level: int, data: bytes) -> tuple:
+    """Returns the compressed size and the median time to compress in ms"""
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        compressor = COMPRESSORS[encoding](level)
+        compressed = compressor.compress(data) + compressor.finish()
+        timings.append((time.perf_counter() - start) * 1000)
+    return len(compressed), median(timings)
+
+
+def main():
+    """Compresses the listing with every algorithm and level"""
+    data = make_listing(random.Random(42))
+    print(f"{PRODUCTS:,} products, {len(data) / 1024:,.0f} KiB of JSON\n")
+    print(f"{'encoding':<10}{'level':>6}{'KiB':>10}{'ratio':>8}{'ms':>10}{'MiB/s':>9}")
+    for encoding, levels in LEVELS.items():
+        if encoding not in COMPRESSORS:
+            continue
+        for level in levels:
+            size, elapsed = time_compression(encoding, level, data)
+            print(
+                f"{encoding:<10}{level:>6}{size / 1024:>10,.0f}"
+                f"{len(data) / size:>7.1f}x{elapsed:>10.1f}"
+                f"{len(data) / 1048576 / (elapsed / 1000):>9.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
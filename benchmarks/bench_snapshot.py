@@ -0,0 +1,83 @@
+"""
+Snapshot Benchmark
+
+Times the unfiltered product listing served from the database and from the
+catalog snapshot, plain and gzip compressed, through the Flask test client
+so only the work of the worker is measured. Products are added to the
+database for the run and removed afterwards, so a PostgreSQL database is
+required.
+
+Usage:
+    DATABASE_URI=postgresql+psycopg://... python benchmarks/bench_snapshot.py [products]
+"""
+
+import os
+import sys
+import time
+from statistics import median
+from unittest.mock import patch
+
+# Allow running the script from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# pylint: disable=wrong-import-position
+from wsgi import app  # noqa: E402
+from service.common.snapshot import snapshot  # noqa: E402
+from service.models import Product, db  # noqa: E402
+
+PRODUCTS = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+RUNS = 50
+
+
+def make_products() -> list:
+    """Returns made up Products to add to the database"""
+    return [
+        Product(
+            name=f"bench product {n}",
+            description=f"a product added by the snapshot benchmark, number {n}",
+            price=n % 10000 / 100,
+            image_url=f"https://images.example.com/products/{n}.png",
+            available=n % 3 == 0,
+        )
+        for n in range(PRODUCTS)
+    ]
+
+
+def time_listing(client, headers: dict) -> tuple:
+    """Returns the median time of a listing in ms and its size in bytes"""
+    timings = []
+    size = 0
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        response = client.get("/api/products", headers=headers)
+        size = len(response.data)
+        timings.append((time.perf_counter() - start) * 1000)
+    return median(timings), size
+
+
+def main():
+    """Times the listing with and without the snapshot"""
+    with app.app_context():
+        ids = Product.create_many(make_products(), 1000)
+        try:
+            client = app.test_client()
+            total = Product.query.count()
+            print(f"{total:,} products, median of {RUNS} requests\n")
+            print(f"{'source':<12}{'encoding':<10}{'ms':>10}{'KiB':>10}")
+            for enabled in (False, True):
+                with patch.multiple(snapshot, enabled=enabled, max_age=3600.0):
+                    snapshot.invalidate()
+                    for encoding in ("identity", "gzip"):
+                        elapsed, size = time_listing(
+                            client, {"Accept-Encoding": encoding}
+                        )
+                        source = "snapshot" if enabled else "database"
+                        print(
+                            f"{source:<12}{encoding:<10}{elapsed:>10.2f}{size / 1024:>10,.0f}"
+                        )
+        finally:
+            Product.delete_many(Product.query.filter(Product.id.in_(ids)))
+            db.session.remove()
+
+
+if __name__ == "__main__":
+    main()
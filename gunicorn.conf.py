@@ -0,0 +1,119 @@
+"""
+Gunicorn configuration for the Product service
+
+Gunicorn loads this file from the working directory on startup. Every
+setting can be changed through the environment variable next to it, and
+command line options still take precedence over this file.
+"""
+
+import math
+import os
+import shutil
+import tempfile
+
+# Every worker writes its Prometheus samples here so that /metrics can
+# aggregate them. It must be set before the workers import the service.
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR",
+    os.path.join(tempfile.gettempdir(), "products-prometheus"),
+)
+
+
+def cpu_limit() -> float:
+    """Returns the CPUs this container may use, from its cgroup CPU quota
+
+    Falls back to the CPUs the process may run on when there is no quota,
+    as os.cpu_count() reports every CPU of the node.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:  # macOS
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max", encoding="utf-8") as cpu_max:
+            quota, period = cpu_max.read().split()
+    except OSError:
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", encoding="utf-8") as f:
+                quota = f.read().strip()
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", encoding="utf-8") as f:
+                period = f.read().strip()
+        except OSError:
+            return cpus
+    if quota in ("max", "-1"):
+        return cpus
+    return min(cpus, int(quota) / int(period))
+
+
+# sync, gthread, gevent (pip install gevent) or uvicorn_worker.UvicornWorker
+# with asgi:app. gthread serves requests on threads that share the database
+# pool of their worker, so keep the threads at or below DB_POOL_SIZE
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "4" if worker_class == "gthread" else "1"))
+
+# A sync worker serves one request at a time, so it needs more workers than
+# CPUs to hide database round trips. The other classes overlap requests
+# within a worker, and one worker per CPU keeps memory low.
+_cpus = max(1, math.ceil(cpu_limit()))
+workers = int(
+    os.getenv(
+        "GUNICORN_WORKERS",
+        os.getenv(
+            "WEB_CONCURRENCY", str(2 * _cpus + 1 if worker_class == "sync" else _cpus)
+        ),
+    )
+)
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '8080')}")
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+
+# Seconds an idle client connection is kept open for its next request
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# Workers are replaced after about max_requests requests to bound slow
+# memory growth. The jitter keeps them from all restarting at once.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+# Load the service once in the master so workers share its memory and start
+# faster. post_fork() makes sure they do not share its database connections.
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("true", "1")
+
+
+def on_starting(_server):
+    """Starts from an empty metrics directory on every (re)start"""
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+
+
+def post_fork(server, _worker):
+    """Drops the database connections a worker inherited from the master
+
+    The preloaded service connects to the database to create its tables.
+    Two processes must never use the same connection, so every worker
+    starts with an empty pool. close=False leaves the sockets open for the
+    master, which still owns them.
+    """
+    if not server.cfg.preload_app:
+        return
+    app = server.app.wsgi()
+    if hasattr(app, "app_context"):
+        # pylint: disable=import-outside-toplevel
+        from service.models import db
+        from service.common.replicas import replicas
+
+        with app.app_context():
+            for engine in [*db.engines.values(), *replicas.engines]:
+                engine.dispose(close=False)
+    else:
+        app.state.engine.sync_engine.dispose(close=False)
+
+
+def child_exit(_server, worker):
+    """Drops the live gauges of a worker that exited"""
+    # pylint: disable=import-outside-toplevel
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -22,7 +22,7 @@ import sys
 from flask import Flask
 from flask_restx import Api
 from service import config
-from service.common import log_handlers
+from service.common import fast_json, log_handlers
 
 
 # Will be initialize when app is created
@@ -41,8 +41,24 @@ def create_app():
     # Initialize Plugins
     # pylint: disable=import-outside-toplevel
     from service.models import db
+    from service.common.cache import cache
+    from service.common.name_index import name_index
+    from service.common.replicas import replicas
+    from service.common.snapshot import snapshot
+    from service.common import compression, metrics, query_log
+    from service.common.pool import engine_options
 
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+        app.config["SQLALCHEMY_DATABASE_URI"], app.config["SQLALCHEMY_ENGINE_OPTIONS"]
+    )
     db.init_app(app)
+    replicas.init_app(app, db.session)
+    cache.init_app(app)
+    name_index.init_app(app)
+    snapshot.init_app(app)
+    metrics.init_app(app)
+    query_log.init_app(app)
+    compression.init_app(app)
 
     ######################################################################
     # Configure Swagger before initializing it
@@ -55,9 +71,11 @@ def create_app():
         description="This is a sample server Product store server.",
         default="products",
         default_label="Product shop operations",
-        doc="/apidocs",  # default also could use doc='/apidocs/'
+        doc="/apidocs" if app.config["API_DOCS"] else False,
         prefix="/api",
     )
+    # Encode every JSON response with orjson
+    api.representation("application/json")(fast_json.output_json)
 
     with app.app_context():
         # Dependencies require we import the routes AFTER the Flask app is created
@@ -65,12 +83,13 @@ def create_app():
         from service import routes, models  # noqa: F401 E402
         from service.common import error_handlers, cli_commands  # noqa: F401, E402
 
-        try:
-            db.create_all()
-        except Exception as error:  # pylint: disable=broad-except
-            app.logger.critical("%s: Cannot continue", error)
-            # gunicorn requires exit code 4 to stop spawning workers when they die
-            sys.exit(4)
+        if app.config["DB_AUTO_CREATE"]:
+            try:
+                db.create_all()
+            except Exception as error:  # pylint: disable=broad-except
+                app.logger.critical("%s: Cannot continue", error)
+                # gunicorn requires exit code 4 to stop spawning workers when they die
+                sys.exit(4)
 
         # Set up logging for production
         log_handlers.init_logging(app, "gunicorn.error")
@@ -0,0 +1,522 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Asynchronous Product Service
+
+Serves the product API as an ASGI application. Every database round trip
+is awaited through the asyncio extension of SQLAlchemy on psycopg's async
+mode, so a worker goes on serving other requests while a query runs
+instead of being blocked for the whole round trip.
+
+The handlers answer like the WSGI routes, byte for byte. Bulk operations,
+search and autocomplete are only served by the WSGI service, and reads go
+straight to the database without the product cache. The stream of product
+events is only served here, since every client holds its request open.
+
+Paths:
+------
+GET /health - Let them know our heart is still beating
+GET /api/products - Returns a list all of the Products, with the same
+    filters, pages, fields and streams as the WSGI service
+GET /api/products/{id} - Returns the Product with a given id number
+POST /api/products - creates a new Product record in the database
+PUT /api/products/{id} - updates a Product record in the database
+DELETE /api/products/{id} - deletes a Product record in the database
+PUT /api/products/{id}/purchase - purchases an available Product
+GET /api/products/events - Streams the changes to the Products as
+    server-sent events
+"""
+
+import logging
+from contextlib import asynccontextmanager
+from decimal import Decimal
+import orjson
+from flask_restx import inputs
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm.exc import StaleDataError
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.http import parse_etags, quote_etag
+from service import config
+from service.common import fast_json, status
+from service.common.events import ChangeBroker
+from service.common.fast_json import product_document
+from service.common.pool import engine_options
+from service.common.query_args import decode_change_token, encode_change_token
+from service.common.query_args import decode_cursor, encode_cursor, field_list
+from service.models import Product, ProductChange, DataConflictError
+from service.models import DataValidationError
+from service.models import SEARCH_FILTERS, parse_id
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def stream_format(value: str) -> str:
+    """Parses the stream argument of a listing"""
+    if value not in ("json", "ndjson"):
+        raise ValueError("choose from json, ndjson")
+    return value
+
+
+# query string arguments of a listing and how each one is parsed
+product_args = {
+    "name": str,
+    "description": str,
+    "available": inputs.boolean,
+    "price": Decimal,
+    "price_min": Decimal,
+    "price_max": Decimal,
+    "image_url": str,
+    "limit": inputs.int_range(1, config.PAGE_SIZE_MAX),
+    "cursor": str,
+    "fields": field_list,
+    "stream": stream_format,
+}
+
+
+######################################################################
+# GET HEALTH CHECK
+######################################################################
+async def health_check(_request: Request) -> Response:
+    """Let them know our heart is still beating"""
+    return json_response({"message": "Healthy", "status": 200})
+
+
+######################################################################
+# LIST ALL PRODUCTS
+######################################################################
+async def list_products(request: Request) -> Response:
+    """Returns all of the Products"""
+    logger.info("Request to list Products...")
+    args = parse_args(request, product_args)
+    filters = {key: args[key] for key in SEARCH_FILTERS}
+    statement = select(*Product.response_column_list(args["fields"])).where(
+        *Product.search_criteria(**filters)
+    )
+    sessions = request.app.state.sessions
+
+    headers = {}
+    if args["limit"] or args["cursor"]:
+        limit = args["limit"] or config.PAGE_SIZE_DEFAULT
+        after_id = decode_cursor(args["cursor"])
+        if after_id is not None:
+            statement = statement.where(Product.id > after_id)
+        async with sessions() as session:
+            result = await session.execute(
+                statement.order_by(Product.id).limit(limit + 1)
+            )
+            products = result.all()
+        if len(products) > limit:
+            products = products[:limit]
+            headers["X-Next-Cursor"] = encode_cursor(products[-1].id)
+        if args["stream"]:
+            return stream_products(
+                in_batches(products), args["stream"], headers, args["fields"]
+            )
+    elif args["stream"]:
+        return stream_products(
+            fetch_batches(sessions, statement), args["stream"], headers, args["fields"]
+        )
+    else:
+        async with sessions() as session:
+            products = (await session.execute(statement)).all()
+
+    results = [product_document(product, args["fields"]) for product in products]
+    return json_response(results, headers=headers)
+
+
+######################################################################
+# RETRIEVE A PRODUCT
+######################################################################
+async def get_product(request: Request) -> Response:
+    """Retrieve a single Product"""
+    product_id = request.path_params["product_id"]
+    logger.info("Request to Retrieve a product with id [%s]", product_id)
+    async with request.app.state.sessions() as session:
+        product = await find(session, product_id)
+    if not product:
+        raise HTTPException(
+            status.HTTP_404_NOT_FOUND, f"Product with id '{product_id}' was not found."
+        )
+
+    # The ETag comes from the row version, so an unchanged Product is
+    # answered without serializing it
+    etag = product.etag()
+    headers = {"ETag": quote_etag(etag)}
+    if parse_etags(request.headers.get("if-none-match")).contains_weak(etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return json_response(product_document(product), headers=headers)
+
+
+######################################################################
+# ADD A NEW PRODUCT
+######################################################################
+async def create_product(request: Request) -> Response:
+    """Creates a Product"""
+    logger.info("Request to Create a Product")
+    product = Product().deserialize(await read_payload(request))
+    async with request.app.state.sessions() as session:
+        session.add(product)
+        await commit(session, product)
+    request.app.state.broker.record("insert", product)
+    logger.info("Product with new id [%s] created!", product.id)
+    location_url = str(request.url_for("product", product_id=product.id))
+    return json_response(
+        product_document(product),
+        status.HTTP_201_CREATED,
+        {"Location": location_url},
+    )
+
+
+######################################################################
+# UPDATE AN EXISTING PRODUCT
+######################################################################
+async def update_product(request: Request) -> Response:
+    """Update a Product, only if it still matches If-Match when one is sent"""
+    product_id = request.path_params["product_id"]
+    logger.info("Request to Update a product with id [%s]", product_id)
+    async with request.app.state.sessions() as session:
+        product = await find(session, product_id)
+        if not product:
+            raise HTTPException(
+                status.HTTP_404_NOT_FOUND,
+                f"Product with id '{product_id}' was not found.",
+            )
+        if_match = parse_etags(request.headers.get("if-match"))
+        if if_match and not if_match.contains_weak(product.etag()):
+            raise HTTPException(
+                status.HTTP_412_PRECONDITION_FAILED,
+                f"Product with id '{product_id}' has changed since it was read.",
+            )
+        product.deserialize(await read_payload(request))
+        await commit(session, product)
+    request.app.state.broker.record("update", product)
+    logger.info("Product with ID: %d updated.", product.id)
+    return json_response(
+        product_document(product), headers={"ETag": quote_etag(product.etag())}
+    )
+
+
+######################################################################
+# DELETE A PRODUCT
+######################################################################
+async def delete_product(request: Request) -> Response:
+    """Delete a Product"""
+    product_id = request.path_params["product_id"]
+    logger.info("Request to Delete a product with id [%s]", product_id)
+    async with request.app.state.sessions() as session:
+        product = await find(session, product_id)
+        if product:
+            await session.delete(product)
+            await commit(session, product)
+            request.app.state.broker.record("delete", product)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+######################################################################
+# PURCHASE A PRODUCT
+######################################################################
+async def purchase_product(request: Request) -> Response:
+    """Purchase a Product and make it unavailable"""
+    product_id = request.path_params["product_id"]
+    logger.info("Request to Purchase a Product")
+    key = parse_id(product_id)
+    async with request.app.state.sessions() as session:
+        row = None
+        if key is not None:
+            row = (await session.execute(Product.purchase_statement(key))).first()
+            await session.commit()
+        if row is None:
+            # Only a failed purchase needs a read, to explain why it failed
+            if not await find(session, product_id):
+                raise HTTPException(
+                    status.HTTP_404_NOT_FOUND,
+                    f"Product with id [{product_id}] was not found.",
+                )
+            raise HTTPException(
+                status.HTTP_409_CONFLICT,
+                f"Product with id [{product_id}] is not available.",
+            )
+    product = Product(**row._mapping)
+    request.app.state.broker.record("purchase", product)
+    logger.info("Product with id [%s] has been purchased!", product_id)
+    return json_response(product.serialize())
+
+
+######################################################################
+# STREAM PRODUCT EVENTS
+######################################################################
+async def product_events(request: Request) -> StreamingResponse:
+    """Streams the changes to the Products as server-sent events
+
+    Every id argument limits the stream to one more Product. A client that
+    reconnects sends the id of the last event it received in Last-Event-ID,
+    or as since, and gets every change it missed first.
+    """
+    product_ids = set()
+    for value in request.query_params.getlist("id"):
+        key = parse_id(value)
+        if key is None:
+            raise DataValidationError(f"Invalid id: {value}")
+        product_ids.add(key)
+    token = request.headers.get("last-event-id") or request.query_params.get("since")
+    position = decode_change_token(token) if token else None
+    logger.info("Request to stream the events of Products %s", product_ids or "all")
+    changes = request.app.state.broker.changes(product_ids, position)
+
+    async def generate():
+        try:
+            async for change in changes:
+                yield b": keepalive\n\n" if change is None else event_message(change)
+        finally:
+            await changes.aclose()
+
+    return StreamingResponse(
+        generate(),
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        media_type="text/event-stream",
+    )
+
+
+######################################################################
+# ERROR HANDLERS
+######################################################################
+async def http_error(_request: Request, error: HTTPException) -> Response:
+    """Answers HTTP errors with the message of the error"""
+    logger.error(error.detail)
+    return json_response({"message": error.detail}, error.status_code, error.headers)
+
+
+async def request_validation_error(_request: Request, error) -> Response:
+    """Handles Value Errors from bad data"""
+    message = str(error)
+    logger.error(message)
+    return json_response(
+        {
+            "status_code": status.HTTP_400_BAD_REQUEST,
+            "error": "Bad Request",
+            "message": message,
+        },
+        status.HTTP_400_BAD_REQUEST,
+    )
+
+
+async def request_conflict_error(_request: Request, error) -> Response:
+    """Handles updates that lost a race with another request"""
+    message = str(error)
+    logger.warning(message)
+    return json_response(
+        {
+            "status_code": status.HTTP_409_CONFLICT,
+            "error": "Conflict",
+            "message": message,
+        },
+        status.HTTP_409_CONFLICT,
+    )
+
+
+######################################################################
+#  U T I L I T Y   F U N C T I O N S
+######################################################################
+
+
+def json_response(data, code: int = status.HTTP_200_OK, headers=None) -> Response:
+    """Makes a response with a body encoded like fast_json.output_json"""
+    return Response(
+        fast_json.encode(data) + b"\n",
+        status_code=code,
+        headers=headers,
+        media_type="application/json",
+    )
+
+
+def parse_args(request: Request, parsers: dict) -> dict:
+    """Parses the query string arguments, None for those not given"""
+    args = {}
+    for name, parse in parsers.items():
+        value = request.query_params.get(name)
+        try:
+            args[name] = None if value is None else parse(value)
+        except (ValueError, ArithmeticError) as error:
+            raise DataValidationError(f"Invalid {name}: {value}") from error
+    return args
+
+
+async def read_payload(request: Request):
+    """Returns the decoded JSON body of a request"""
+    try:
+        return orjson.loads(await request.body())
+    except orjson.JSONDecodeError as error:
+        raise DataValidationError(f"Invalid JSON body: {error}") from error
+
+
+async def find(session, by_id):
+    """Finds a Product by it's ID, None when there is none"""
+    key = parse_id(by_id)
+    if key is None:
+        return None
+    return await session.get(Product, key)
+
+
+async def commit(session, product: Product) -> None:
+    """Commits a change to a Product like its synchronous methods do"""
+    # A failed commit expires the Product, which cannot be reloaded here
+    key = product.id
+    try:
+        await session.commit()
+    except StaleDataError as error:
+        await session.rollback()
+        logger.warning("Conflict updating record: %s", key)
+        raise DataConflictError(
+            f"Product with id [{key}] was changed by another request"
+        ) from error
+    except Exception as error:
+        await session.rollback()
+        logger.error("Error saving record: %s", key)
+        raise DataValidationError(error) from error
+
+
+def event_message(change) -> bytes:
+    """Encodes a change as a server-sent event named after its operation"""
+    token = encode_change_token(change.txid, change.id)
+    data = fast_json.encode({"token": token, **change.serialize()})
+    return b"id: %s\nevent: %s\ndata: %s\n\n" % (
+        token.encode(),
+        change.operation.encode(),
+        data,
+    )
+
+
+async def fetch_batches(sessions, statement):
+    """Yields the rows of a query STREAM_BATCH_SIZE at a time
+
+    The rows come from a server-side cursor, so memory use does not grow
+    with the size of the listing.
+    """
+    async with sessions() as session:
+        result = await session.stream(
+            statement.execution_options(yield_per=config.STREAM_BATCH_SIZE)
+        )
+        async for batch in result.partitions():
+            yield batch
+
+
+async def in_batches(rows: list):
+    """Yields rows already read STREAM_BATCH_SIZE at a time"""
+    size = config.STREAM_BATCH_SIZE
+    for start in range(0, len(rows), size):
+        end = start + size
+        yield rows[start:end]
+
+
+def stream_products(
+    batches, output: str, headers: dict, names: list = None
+) -> StreamingResponse:
+    """Streams batches of Products as a JSON array or as newline delimited JSON"""
+
+    def encode(batch) -> list:
+        return [fast_json.encode(product_document(row, names)) for row in batch]
+
+    async def generate_ndjson():
+        async for batch in batches:
+            yield b"\n".join(encode(batch)) + b"\n"
+
+    async def generate_json():
+        prefix = b"["
+        async for batch in batches:
+            yield prefix + b",".join(encode(batch))
+            prefix = b","
+        yield b"[]\n" if prefix == b"[" else b"]\n"
+
+    if output == "ndjson":
+        generate, media_type = generate_ndjson, "application/x-ndjson"
+    else:
+        generate, media_type = generate_json, "application/json"
+    return StreamingResponse(generate(), headers=headers, media_type=media_type)
+
+
+############################################################
+# Initialize the Starlette instance
+############################################################
+def create_app(database_uri: str = None) -> Starlette:
+    """Creates the ASGI application and its async database engine"""
+    database_uri = database_uri or config.DATABASE_URI
+    options = engine_options(
+        database_uri, config.SQLALCHEMY_ENGINE_OPTIONS, asynchronous=True
+    )
+    engine = create_async_engine(database_uri, **options)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    # The broker listens on a plain psycopg connection to the same database
+    listen_url = None
+    if config.EVENTS_LISTEN and engine.dialect.name == "postgresql":
+        listen_url = engine.url.set(drivername="postgresql").render_as_string(
+            hide_password=False
+        )
+    local = not ProductChange.recorded(engine.dialect.name)
+    if local:
+        logger.warning(
+            "%s does not record the change feed, so the events of a worker "
+            "only carry the changes made through it",
+            engine.dialect.name,
+        )
+    broker = ChangeBroker(sessions, listen_url, local)
+
+    @asynccontextmanager
+    async def lifespan(_app: Starlette):
+        if config.DB_AUTO_CREATE:
+            async with engine.begin() as connection:
+                await connection.run_sync(Product.metadata.create_all)
+        logger.info("Service initialized!")
+        yield
+        await broker.stop()
+        await engine.dispose()
+
+    app = Starlette(
+        routes=[
+            Route("/health", health_check, methods=["GET"]),
+            Route("/api/products", list_products, methods=["GET"]),
+            Route("/api/products", create_product, methods=["POST"]),
+            Route("/api/products/events", product_events, methods=["GET"]),
+            Route(
+                "/api/products/{product_id}",
+                get_product,
+                methods=["GET"],
+                name="product",
+            ),
+            Route("/api/products/{product_id}", update_product, methods=["PUT"]),
+            Route("/api/products/{product_id}", delete_product, methods=["DELETE"]),
+            Route(
+                "/api/products/{product_id}/purchase",
+                purchase_product,
+                methods=["PUT"],
+            ),
+        ],
+        exception_handlers={
+            HTTPException: http_error,
+            DataValidationError: request_validation_error,
+            DataConflictError: request_conflict_error,
+        },
+        lifespan=lifespan,
+    )
+    app.state.engine = engine
+    app.state.sessions = sessions
+    app.state.broker = broker
+    return app
@@ -0,0 +1,185 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Product Cache
+
+A read-through cache for single Product lookups. Entries are kept in an
+in-process LRU with a time to live, or in Redis when CACHE_URL is set so
+that every worker shares them. Redis holds the values as JSON, so only JSON
+types can be cached.
+"""
+import threading
+import time
+from collections import OrderedDict
+import orjson
+
+
+class LocalBackend:
+    """In-process LRU cache whose entries expire after a time to live"""
+
+    name = "local"
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached value or None when missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Caches a value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Removes a value from the cache"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Removes every value from the cache"""
+        with self._lock:
+            self._entries.clear()
+
+    def size(self) -> int:
+        """Returns the number of cached entries"""
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Cache shared by every worker through a Redis server"""
+
+    name = "redis"
+
+    def __init__(self, client, ttl: float, prefix: str = "products:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        """Returns the cached value or None when missing or expired"""
+        data = self.client.get(f"{self.prefix}{key}")
+        return None if data is None else orjson.loads(data)
+
+    def set(self, key, value):
+        """Caches a value until its time to live runs out"""
+        self.client.set(
+            f"{self.prefix}{key}", orjson.dumps(value), px=int(self.ttl * 1000)
+        )
+
+    def delete(self, key):
+        """Removes a value from the cache"""
+        self.client.delete(f"{self.prefix}{key}")
+
+    def clear(self):
+        """Removes every value with this cache's prefix"""
+        keys = list(self.client.scan_iter(match=f"{self.prefix}*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def size(self) -> int:
+        """Returns the number of cached entries"""
+        return sum(1 for _ in self.client.scan_iter(match=f"{self.prefix}*"))
+
+
+class Cache:
+    """
+    Read-through cache with hit and miss counters
+
+    The backend is chosen when the app is initialized. Until then, or when
+    CACHE_MAXSIZE is 0, every lookup is a miss and writes are ignored.
+    """
+
+    def __init__(self):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        # the threads of a worker count their lookups at the same time
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Selects the cache backend from the app configuration"""
+        with self._lock:
+            self.hits = self.misses = 0
+        ttl = app.config["CACHE_TTL"]
+        if app.config["CACHE_URL"]:
+            # pylint: disable=import-outside-toplevel
+            import redis
+
+            client = redis.Redis.from_url(app.config["CACHE_URL"])
+            self.backend = RedisBackend(client, ttl)
+        elif app.config["CACHE_MAXSIZE"] > 0:
+            self.backend = LocalBackend(app.config["CACHE_MAXSIZE"], ttl)
+        else:
+            self.backend = None
+
+    def get(self, key):
+        """Returns the cached value for key, counting the hit or miss"""
+        value = self.backend.get(key) if self.backend else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Caches a value"""
+        if self.backend:
+            self.backend.set(key, value)
+
+    def delete(self, key):
+        """Invalidates the value cached for key"""
+        if self.backend:
+            self.backend.delete(key)
+
+    def clear(self):
+        """Invalidates every cached value"""
+        if self.backend:
+            self.backend.clear()
+
+    def stats(self) -> dict:
+        """Returns the counters used to size the cache"""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "backend": self.backend.name if self.backend else None,
+            "size": self.backend.size() if self.backend else 0,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Will be initialized when the app is created
+cache = Cache()
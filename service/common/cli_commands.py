@@ -16,8 +16,10 @@
 """
 Flask CLI Command Extensions
 """
+import click
 from flask import current_app as app  # Import Flask application
-from service.models import db
+from service import migrations
+from service.models import ProductChange, db
 
 
 ######################################################################
@@ -36,6 +38,64 @@ def db_create():
     db.session.commit()
 
 
+######################################################################
+# Command to bring the schema up to date
+# Usage:
+#   flask db-init
+######################################################################
+@app.cli.command("db-init")
+def db_init():
+    """Applies the pending migrations, keeping existing data"""
+    migrations.upgrade(db.engine, app.config)
+    print("Database is initialized.")
+
+
+######################################################################
+# Command to apply the migrations, or report what they would lock
+# Usage:
+#   flask db-upgrade [--target VERSION] [--dry-run]
+######################################################################
+@app.cli.command("db-upgrade")
+@click.option("--target", type=int, help="Last version to apply")
+@click.option("--dry-run", is_flag=True, help="Report the steps and their locks")
+def db_upgrade(target, dry_run):
+    """Applies the pending migrations up to the target version"""
+    if dry_run:
+        pending = migrations.pending(db.engine, target)
+        for line in migrations.plan(pending) or ["No pending migrations."]:
+            print(line)
+        return
+    for migration in migrations.upgrade(db.engine, app.config, target):
+        print(f"Applied {migration.version:04d} {migration.name}")
+
+
+######################################################################
+# Command to list the migrations and whether they are applied
+# Usage:
+#   flask db-status
+######################################################################
+@app.cli.command("db-status")
+def db_status():
+    """Lists the migrations and whether they have been applied"""
+    for migration, applied in migrations.status(db.engine):
+        state = "applied" if applied else "pending"
+        print(
+            f"{migration.version:04d} {migration.name:<24}{state:<9}{migration.description}"
+        )
+
+
+######################################################################
+# Command to drop the changes that later changes made obsolete
+# Usage:
+#   flask changes-compact
+######################################################################
+@app.cli.command("changes-compact")
+def changes_compact():
+    """Removes the Product changes superseded by a later version of the Product"""
+    count = ProductChange.compact()
+    print(f"Compacted {count} changes.")
+
+
 @app.cli.command("reset-db")
 def reset_db():
     """Drops all tables and recreates them."""
@@ -0,0 +1,170 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+
+"""
+Response Compression
+
+Compresses responses with zstd, brotli or gzip, whichever the client
+accepts with the highest quality, ties going to the order of
+COMPRESS_ALGORITHMS. Bodies shorter than COMPRESS_MIN_SIZE are sent as
+they are, and streamed responses are compressed chunk by chunk.
+"""
+import zlib
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+class GzipCompressor:
+    """Streaming gzip compressor"""
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        """Compresses a chunk, flushing it so it can be sent right away"""
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self) -> bytes:
+        """Returns the end of the compressed stream"""
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+    """Streaming brotli compressor"""
+
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        """Compresses a chunk, flushing it so it can be sent right away"""
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        """Returns the end of the compressed stream"""
+        return self._compressor.finish()
+
+
+class ZstdCompressor:
+    """Streaming zstd compressor"""
+
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        """Compresses a chunk, flushing it so it can be sent right away"""
+        return self._compressor.compress(data) + self._compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self) -> bytes:
+        """Returns the end of the compressed stream"""
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+# Content codings this worker can produce
+COMPRESSORS = {"gzip": GzipCompressor}
+if brotli:
+    COMPRESSORS["br"] = BrotliCompressor
+if zstandard:
+    COMPRESSORS["zstd"] = ZstdCompressor
+
+
+def init_app(app):
+    """Compresses the responses of the app"""
+    app.after_request(compress_response)
+
+
+def choose_encoding(accept_encodings, algorithms) -> str:
+    """Returns the content coding to use for an Accept-Encoding header
+
+    Args:
+        accept_encodings: the parsed Accept-Encoding header of the request
+        algorithms (list): the content codings allowed, preferred first
+
+    :return: the content coding, or None to send the body as it is
+    :rtype: str
+    """
+    best, best_quality = None, 0
+    for name in algorithms:
+        quality = accept_encodings[name]
+        if name in COMPRESSORS and quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def compress_response(response):
+    """Compresses the body of a response when the client accepts it"""
+    config = current_app.config
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in config["COMPRESS_MIMETYPES"]
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    if (
+        not response.is_streamed
+        and len(response.get_data()) < config["COMPRESS_MIN_SIZE"]
+    ):
+        return response
+    encoding = choose_encoding(request.accept_encodings, config["COMPRESS_ALGORITHMS"])
+    if encoding is None:
+        return response
+
+    compressor = COMPRESSORS[encoding](config["COMPRESS_LEVELS"][encoding])
+    if response.is_streamed:
+        response.response = compress_stream(response.response, compressor)
+        response.headers.pop("Content-Length", None)
+    else:
+        response.set_data(
+            compressor.compress(response.get_data()) + compressor.finish()
+        )
+    response.headers["Content-Encoding"] = encoding
+
+    # The compressed bytes differ from the ones the ETag was made for
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def compress_stream(chunks, compressor):
+    """Compresses a streamed body chunk by chunk"""
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close:
+            close()
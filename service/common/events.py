@@ -0,0 +1,248 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+
+"""
+Product Events
+
+Hands the changes to the Products over to the clients of the server-sent
+events stream of the ASGI service. Every worker runs a single reader task
+that reads the change feed after the last change it handed over and puts
+each change on the queue of every subscriber that asked for it. The reader
+wakes up when PostgreSQL notifies it of a commit on CHANGES_CHANNEL, and
+every EVENTS_POLL_INTERVAL seconds in any case, because a change is only
+listed once all older transactions have ended. Without a notification
+connection the reader simply polls. A subscriber costs a queue, not a
+worker, and the database sees one reader per worker however many clients
+are connected.
+
+Only PostgreSQL records the change feed. On any other database the broker
+is local: it reads nothing, and the handlers of the worker record their
+own changes with it as they commit, so the stream only carries the
+changes made through that worker.
+"""
+import asyncio
+import itertools
+import logging
+from datetime import datetime, timezone
+import psycopg
+from service import config
+from service.common.fast_json import product_document
+from service.models import CHANGES_CHANNEL, Product, ProductChange
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class Subscription:
+    """The queue of the changes waiting to be sent to one client"""
+
+    def __init__(self, product_ids: set, size: int):
+        self.product_ids = product_ids
+        self.queue = asyncio.Queue(size)
+        self.closed = False
+
+    def offer(self, change: ProductChange) -> None:
+        """Queues a change the client asked for
+
+        A client that falls behind by a full queue is closed instead of
+        holding changes in memory, and catches up from the change feed
+        when it reconnects with the id of the last event it received.
+        """
+        if self.closed or (
+            self.product_ids and change.product_id not in self.product_ids
+        ):
+            return
+        try:
+            self.queue.put_nowait(change)
+        except asyncio.QueueFull:
+            logger.warning("Closing an event stream that fell behind")
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            self.closed = True
+
+
+class ChangeBroker:
+    """Fans the changes to the Products out to the subscribers of a worker"""
+
+    def __init__(self, sessions, listen_url: str = None, local: bool = False):
+        self.sessions = sessions
+        self.listen_url = listen_url
+        # a local broker only hands over the changes recorded with it
+        self.local = local
+        self._change_ids = itertools.count(1)
+        self.subscriptions = set()
+        # the (txid, id) position of the last change handed over
+        self.position = None
+        self.running = False
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+
+    def start(self) -> None:
+        """Starts the reader, and the listener when there is a URL, once"""
+        if self._tasks or self.local:
+            return
+        self.running = True
+        self._tasks.append(asyncio.create_task(self._read()))
+        if self.listen_url:
+            self._tasks.append(asyncio.create_task(self._listen()))
+
+    async def stop(self) -> None:
+        """Stops the tasks of the broker"""
+        # psycopg can lose a cancellation that races a notification, so the
+        # tasks also end by themselves once the broker is not running
+        self.running = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake_up(self) -> None:
+        """Makes the reader look for new changes now"""
+        self._wakeup.set()
+
+    def record(self, operation: str, product: Product) -> None:
+        """Hands a change just committed by this worker to the subscribers
+
+        Only a local broker does, the others read every change from the
+        change feed.
+        """
+        if not self.local:
+            return
+        deleted = operation == "delete"
+        change = ProductChange(
+            txid=0,
+            id=next(self._change_ids),
+            product_id=product.id,
+            operation=operation,
+            version=product.version + 1 if deleted else product.version,
+            changed_at=datetime.now(timezone.utc),
+            document=None if deleted else product_document(product),
+        )
+        for subscription in list(self.subscriptions):
+            subscription.offer(change)
+
+    async def publish(self) -> int:
+        """Hands the changes listed since the last call to the subscribers
+
+        The first call only takes the current position.
+
+        :return: the number of changes handed over
+        :rtype: int
+        """
+        limit = config.CHANGES_LIMIT_MAX
+        count = 0
+        async with self.sessions() as session:
+            while True:
+                horizon = await session.scalar(ProductChange.horizon_statement())
+                if self.position is None:
+                    self.position = (horizon, 0)
+                    return count
+                changes = (
+                    await session.scalars(
+                        ProductChange.after_statement(self.position, horizon, limit)
+                    )
+                ).all()
+                for change in changes:
+                    for subscription in list(self.subscriptions):
+                        subscription.offer(change)
+                    self.position = (change.txid, change.id)
+                count += len(changes)
+                if len(changes) < limit:
+                    self.position = max(self.position, (horizon, 0))
+                    return count
+
+    async def changes(self, product_ids: set, position: tuple = None):
+        """Yields the changes to send to a new subscriber, oldest first
+
+        Only the changes of the Products in product_ids are sent, or all of
+        them when it is empty. With a position, the changes after it are
+        read from the change feed first, unless the broker is local and
+        there is no feed to read. None is yielded whenever no change came
+        for EVENTS_HEARTBEAT seconds, and the changes end when the
+        subscriber falls behind.
+        """
+        self.start()
+        if self.local:
+            position = None
+        subscription = Subscription(product_ids, config.EVENTS_QUEUE_SIZE)
+        # Subscribing first leaves no gap between the feed and the queue
+        self.subscriptions.add(subscription)
+        try:
+            limit = config.CHANGES_LIMIT_MAX
+            while position is not None:
+                async with self.sessions() as session:
+                    horizon = await session.scalar(ProductChange.horizon_statement())
+                    missed = (
+                        await session.scalars(
+                            ProductChange.after_statement(
+                                position, horizon, limit, product_ids
+                            )
+                        )
+                    ).all()
+                for change in missed:
+                    position = (change.txid, change.id)
+                    yield change
+                if len(missed) < limit:
+                    position = max(position, (horizon, 0))
+                    break
+            while True:
+                try:
+                    async with asyncio.timeout(config.EVENTS_HEARTBEAT):
+                        change = await subscription.queue.get()
+                except TimeoutError:
+                    yield None
+                    continue
+                if change is None:
+                    return
+                # Changes already read from the feed are skipped
+                if position is None or (change.txid, change.id) > position:
+                    yield change
+        finally:
+            self.subscriptions.discard(subscription)
+
+    async def _read(self) -> None:
+        """Hands the new changes over whenever woken up or polling"""
+        while self.running:
+            try:
+                await self.publish()
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error("Error reading the Product changes: %s", error)
+            try:
+                async with asyncio.timeout(config.EVENTS_POLL_INTERVAL):
+                    await self._wakeup.wait()
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _listen(self) -> None:
+        """Wakes the reader up whenever a change to the Products commits"""
+        while self.running:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    self.listen_url, autocommit=True
+                ) as connection:
+                    await connection.execute(f"LISTEN {CHANGES_CHANNEL}")
+                    # changes may have committed while nobody was listening
+                    self.wake_up()
+                    while self.running:
+                        async for _notify in connection.notifies(
+                            timeout=config.EVENTS_POLL_INTERVAL
+                        ):
+                            self.wake_up()
+            except psycopg.Error as error:
+                logger.warning("Listening for Product changes failed: %s", error)
+            await asyncio.sleep(config.EVENTS_POLL_INTERVAL)
@@ -0,0 +1,75 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+
+"""
+Fast JSON
+
+Encodes responses with orjson. Listings select only the response columns
+as tuples and turn each row straight into its response document, instead
+of building Product.serialize() and marshalling it with product_model.
+The documents are the same, key for key, so both paths give the same bytes.
+"""
+import orjson
+from flask import current_app
+
+
+def product_document(row, fields=None) -> dict:
+    """Returns the response document of a Product or of a row of its columns
+
+    Args:
+        row: a Product or a row with its response columns
+        fields (list): only return these fields instead of the whole document
+    """
+    if fields is not None:
+        document = {name: getattr(row, name) for name in fields}
+        if document.get("price") is not None:
+            document["price"] = float(document["price"])
+        return document
+    price = row.price
+    return {
+        "_id": None,
+        "id": row.id,
+        "name": row.name,
+        "description": row.description,
+        "available": row.available,
+        "price": None if price is None else float(price),
+        "image_url": row.image_url,
+    }
+
+
+def encode(data) -> bytes:
+    """Encodes data as compact JSON"""
+    return orjson.dumps(data)
+
+
+def dumps(data) -> bytes:
+    """Encodes a response body, ending with a new line and indented in debug"""
+    option = orjson.OPT_APPEND_NEWLINE
+    if current_app.debug:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(data, option=option)
+
+
+def output_json(data, code, headers=None):
+    """Makes a Flask response with a JSON encoded body
+
+    Registered as the application/json representation of Flask-RESTX and
+    returned directly by the listing endpoints.
+    """
+    return current_app.response_class(
+        dumps(data), status=code, headers=headers, mimetype="application/json"
+    )
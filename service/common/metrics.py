@@ -0,0 +1,106 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+
+"""
+Prometheus Metrics
+
+Request latency, request counts, in-flight requests and database query
+timing per endpoint. Query times are observed by service.common.query_log.
+When PROMETHEUS_MULTIPROC_DIR is set every gunicorn worker writes its
+samples there and /metrics aggregates all of them.
+"""
+import os
+import time
+from flask import g, request
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time spent answering HTTP requests",
+    ["method", "endpoint"],
+)
+REQUEST_COUNT = Counter(
+    "http_requests_total",
+    "HTTP requests answered",
+    ["method", "endpoint", "status"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests being answered",
+    ["method", "endpoint"],
+    multiprocess_mode="livesum",
+)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds",
+    "Time spent running SQL statements",
+    ["endpoint"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+
+def init_app(app):
+    """Records the metrics of every request served by the app"""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
+
+
+def export() -> bytes:
+    """Returns the metrics in the Prometheus text format"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+######################################################################
+#  R E Q U E S T   H O O K S
+######################################################################
+def endpoint_label() -> str:
+    """Returns the endpoint label, avoiding one label per unknown URL"""
+    return request.endpoint or "unmatched"
+
+
+def _start_request():
+    g.metrics_start = time.perf_counter()
+    REQUESTS_IN_PROGRESS.labels(request.method, endpoint_label()).inc()
+
+
+def _finish_request(response):
+    start = g.get("metrics_start")
+    if start is not None:
+        endpoint = endpoint_label()
+        REQUEST_LATENCY.labels(request.method, endpoint).observe(
+            time.perf_counter() - start
+        )
+        REQUEST_COUNT.labels(request.method, endpoint, response.status_code).inc()
+    return response
+
+
+def _teardown_request(_error=None):
+    # teardown also runs when a request fails, so the gauge is lowered here
+    if g.pop("metrics_start", None) is not None:
+        REQUESTS_IN_PROGRESS.labels(request.method, endpoint_label()).dec()
@@ -0,0 +1,163 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+
+"""
+Product Name Index
+
+An in-process index of the Product names used by autocomplete. Names are
+kept in a sorted array for prefix matches and in a trigram index for
+typo-tolerant matches. Writes made by this worker update it in place, and
+it is reloaded from the database every AUTOCOMPLETE_INDEX_TTL seconds to
+pick up writes made by other workers.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+# Share of the trigrams of the typed text a name must contain to match,
+# the default pg_trgm.word_similarity_threshold
+SIMILARITY_THRESHOLD = 0.6
+
+
+def trigrams(text: str, complete: bool = True) -> set:
+    """Returns the trigrams of every word like pg_trgm does
+
+    Words are padded with two spaces in front and one behind. The last
+    word of a partially typed text is not padded behind, so that it also
+    matches longer words.
+    """
+    words = re.findall(r"\w+", text.lower())
+    result = set()
+    for position, word in enumerate(words):
+        padded = f"  {word}"
+        if complete or position < len(words) - 1:
+            padded += " "
+        result.update(map("".join, zip(padded, padded[1:], padded[2:])))
+    return result
+
+
+class NameIndex:
+    """Prefix and trigram index of the Product names"""
+
+    def __init__(self):
+        self.enabled = False
+        self.ttl = 300.0
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._keys = []  # sorted (lowercase name, id) pairs
+        self._names = {}
+        self._trigrams = defaultdict(set)
+
+    def init_app(self, app):
+        """Enables the index from the app configuration"""
+        self.enabled = app.config["AUTOCOMPLETE_INDEX"]
+        self.ttl = app.config["AUTOCOMPLETE_INDEX_TTL"]
+        self.invalidate()
+
+    def is_stale(self) -> bool:
+        """Returns True when the index must be reloaded before use"""
+        loaded_at = self._loaded_at
+        return loaded_at is None or time.monotonic() - loaded_at > self.ttl
+
+    def invalidate(self):
+        """Forces a reload on the next lookup"""
+        self._loaded_at = None
+
+    def load(self, rows):
+        """Replaces the index with the (id, name) rows given"""
+        keys, names, grams = [], {}, defaultdict(set)
+        for product_id, name in rows:
+            keys.append((name.lower(), product_id))
+            names[product_id] = name
+            for gram in trigrams(name):
+                grams[gram].add(product_id)
+        keys.sort()
+        with self._lock:
+            self._keys, self._names, self._trigrams = keys, names, grams
+            self._loaded_at = time.monotonic()
+
+    def add(self, product_id: int, name: str):
+        """Adds a Product name, replacing the one it had"""
+        if not self.enabled or self.is_stale():
+            return
+        with self._lock:
+            self._remove(product_id)
+            insort(self._keys, (name.lower(), product_id))
+            self._names[product_id] = name
+            for gram in trigrams(name):
+                self._trigrams[gram].add(product_id)
+
+    def remove(self, product_id: int):
+        """Removes a Product name"""
+        if not self.enabled or self.is_stale():
+            return
+        with self._lock:
+            self._remove(product_id)
+
+    def complete(self, text: str, limit: int) -> list:
+        """Returns up to limit (id, name) pairs for a partially typed name
+
+        Names starting with the text come first in alphabetical order,
+        followed by the names sharing the most trigrams with it.
+        """
+        prefix = text.lower()
+        with self._lock:
+            matches = []
+            position = bisect_left(self._keys, (prefix,))
+            while len(matches) < limit and position < len(self._keys):
+                key, product_id = self._keys[position]
+                if not key.startswith(prefix):
+                    break
+                matches.append(product_id)
+                position += 1
+            if len(matches) < limit:
+                matches.extend(self._similar(text, limit - len(matches), matches))
+            return [(product_id, self._names[product_id]) for product_id in matches]
+
+    def _similar(self, text: str, limit: int, exclude: list) -> list:
+        grams = trigrams(text, complete=False)
+        if not grams:
+            return []
+        # A name sharing `needed` trigrams must be in at least one of the
+        # len(grams) - needed + 1 rarest posting lists, so only those are
+        # scanned for candidates
+        needed = int(SIMILARITY_THRESHOLD * len(grams))
+        postings = sorted((self._trigrams.get(gram, set()) for gram in grams), key=len)
+        candidates = set().union(*postings[: len(grams) - needed + 1])
+        candidates.difference_update(exclude)
+        scored = []
+        for product_id in candidates:
+            count = sum(product_id in posting for posting in postings)
+            if count / len(grams) >= SIMILARITY_THRESHOLD:
+                scored.append((-count, self._names[product_id].lower(), product_id))
+        scored.sort()
+        return [product_id for _, _, product_id in scored[:limit]]
+
+    def _remove(self, product_id: int):
+        name = self._names.pop(product_id, None)
+        if name is None:
+            return
+        position = bisect_left(self._keys, (name.lower(), product_id))
+        del self._keys[position]
+        for gram in trigrams(name):
+            self._trigrams[gram].discard(product_id)
+
+
+# Will be initialized when the app is created
+name_index = NameIndex()
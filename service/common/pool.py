@@ -0,0 +1,112 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+
+"""
+Connection Pool
+
+A QueuePool that records how long requests wait for a database connection,
+so the pool of each worker can be sized from live statistics.
+"""
+import threading
+import time
+from sqlalchemy import exc, make_url
+from sqlalchemy.pool import QueuePool
+
+# Options only a QueuePool accepts, dropped for databases using another pool
+QUEUE_POOL_OPTIONS = ("pool_size", "max_overflow", "pool_timeout")
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that times every connection checkout"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._waiting = threading.local()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        # QueuePool retries by calling _do_get again, only time the first call
+        if getattr(self._waiting, "active", False):
+            return super()._do_get()
+        self._waiting.active = True
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            self._waiting.active = False
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+    def stats(self) -> dict:
+        """Returns the pool usage and checkout wait times in milliseconds"""
+        with self._stats_lock:
+            checkouts = self.checkouts
+            wait_total = self.wait_total
+            return {
+                "size": self.size(),
+                "checked_in": self.checkedin(),
+                "checked_out": self.checkedout(),
+                "overflow": self.overflow(),
+                "checkouts": checkouts,
+                "timeouts": self.timeouts,
+                "wait_ms_avg": (
+                    round(wait_total / checkouts * 1000, 3) if checkouts else 0.0
+                ),
+                "wait_ms_max": round(self.wait_max * 1000, 3),
+            }
+
+
+######################################################################
+#  U T I L I T Y   F U N C T I O N S
+######################################################################
+def engine_options(uri: str, options: dict, asynchronous: bool = False) -> dict:
+    """Returns the create_engine() options that suit the pool of a database
+
+    Databases pooled by a QueuePool, such as PostgreSQL, get the sizing
+    options, and a TimedQueuePool unless the engine is asynchronous. Others,
+    such as an in-memory SQLite database held in a StaticPool, keep the
+    pool of their dialect and only get the options every pool accepts.
+    """
+    url = make_url(uri)
+    pool_class = url.get_dialect().get_pool_class(url)
+    if not issubclass(pool_class, QueuePool):
+        return {
+            name: value
+            for name, value in options.items()
+            if name not in QUEUE_POOL_OPTIONS
+        }
+    if asynchronous:
+        return dict(options)
+    return {"poolclass": TimedQueuePool, **options}
+
+
+def pool_stats(pool) -> dict:
+    """Returns the statistics of a pool, or its status if it is not timed"""
+    if isinstance(pool, TimedQueuePool):
+        return pool.stats()
+    return {"status": pool.status()}
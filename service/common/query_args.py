@@ -0,0 +1,91 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Query Arguments
+
+Parsers for the query string arguments of product listings that are shared
+by the WSGI routes and the ASGI application, and the tokens of the change
+feed.
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from service.models import DataValidationError, RESPONSE_FIELDS
+
+# The largest values of the integer and bigint columns positions refer to
+INTEGER_MAX = 2**31 - 1
+BIGINT_MAX = 2**63 - 1
+
+# The largest position of each kind of cursor: a Product id or an offset
+CURSOR_MAX = {"id": INTEGER_MAX, "offset": BIGINT_MAX}
+
+
+def field_list(value: str) -> list:
+    """Parses a comma separated list of Product fields into response order"""
+    names = {name.strip() for name in value.split(",")} - {""}
+    unknown = names.difference(RESPONSE_FIELDS)
+    if not names or unknown:
+        raise ValueError(
+            f"Unknown fields {sorted(unknown)}, choose from {', '.join(RESPONSE_FIELDS)}"
+        )
+    return [name for name in RESPONSE_FIELDS if name in names]
+
+
+field_list.__schema__ = {"type": "string", "format": "csv"}
+
+
+def encode_cursor(position: int, key: str = "id") -> str:
+    """Encodes where the next page starts as an opaque cursor
+
+    Listings page on the id of the last Product seen and ranked search
+    results on the offset of the next result.
+    """
+    return urlsafe_b64encode(f"{key}:{position}".encode()).decode()
+
+
+def decode_cursor(cursor: str, key: str = "id"):
+    """Decodes an opaque cursor back into the position it was made from"""
+    if not cursor:
+        return None
+    try:
+        cursor_key, position = urlsafe_b64decode(cursor.encode()).decode().split(":")
+        if cursor_key != key:
+            raise ValueError(f"unknown cursor key {cursor_key}")
+        position = int(position)
+        if not 0 <= position <= CURSOR_MAX[key]:
+            raise ValueError(f"cursor position {position} out of range")
+        return position
+    except ValueError as error:
+        raise DataValidationError(f"Invalid cursor: {cursor}") from error
+
+
+def encode_change_token(txid: int, change_id: int) -> str:
+    """Encodes the position of a change in the feed as an opaque token"""
+    return urlsafe_b64encode(f"{txid}.{change_id}".encode()).decode()
+
+
+def decode_change_token(token: str) -> tuple:
+    """Decodes a change feed token into a (txid, change id) position"""
+    if not token:
+        return 0, 0
+    try:
+        txid, change_id = map(
+            int, urlsafe_b64decode(token.encode()).decode().split(".")
+        )
+        if not (0 <= txid <= BIGINT_MAX and 0 <= change_id <= BIGINT_MAX):
+            raise ValueError(f"token position {txid}.{change_id} out of range")
+        return txid, change_id
+    except ValueError as error:
+        raise DataValidationError(f"Invalid token: {token}") from error
@@ -0,0 +1,104 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+
+"""
+Query Log
+
+Times every SQL statement through SQLAlchemy engine events. Statements
+slower than SLOW_QUERY_MS are written to a structured slow-query log and
+requests issuing more than QUERY_BUDGET statements are reported.
+"""
+import json
+import logging
+import time
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from service.common.metrics import DB_QUERY_LATENCY, endpoint_label
+
+logger = logging.getLogger("flask.app")
+
+# Longest statement text written to the slow-query log
+STATEMENT_MAX_LENGTH = 1000
+
+
+def init_app(app):
+    """Checks the query budget of every request served by the app"""
+    # teardown runs after a streamed response is exhausted, so its
+    # batch queries are counted too
+    app.teardown_request(_check_query_budget)
+
+
+######################################################################
+#  E N G I N E   E V E N T S
+######################################################################
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(
+    _conn, _cursor, _statement, _parameters, context, _executemany
+):  # pylint: disable=too-many-arguments, too-many-positional-arguments
+    context.query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(
+    _conn, cursor, statement, _parameters, context, _executemany
+):  # pylint: disable=too-many-arguments, too-many-positional-arguments
+    elapsed = time.perf_counter() - context.query_start
+    rows = cursor.rowcount
+    logger.debug("Query took %.2f ms (%s rows)", elapsed * 1000, rows)
+
+    endpoint = None
+    if has_request_context():
+        endpoint = endpoint_label()
+        DB_QUERY_LATENCY.labels(endpoint).observe(elapsed)
+        g.query_count = g.get("query_count", 0) + 1
+        g.query_seconds = g.get("query_seconds", 0.0) + elapsed
+
+    if has_app_context() and elapsed * 1000 >= current_app.config["SLOW_QUERY_MS"]:
+        logger.warning(
+            "Slow query: %s",
+            json.dumps(
+                {
+                    "duration_ms": round(elapsed * 1000, 2),
+                    "rows": rows,
+                    "endpoint": endpoint,
+                    "statement": " ".join(statement.split())[:STATEMENT_MAX_LENGTH],
+                }
+            ),
+        )
+
+
+######################################################################
+#  R E Q U E S T   H O O K S
+######################################################################
+def _check_query_budget(_error=None):
+    count = g.pop("query_count", 0)
+    seconds = g.pop("query_seconds", 0.0)
+    if not count:
+        return
+    summary = {
+        "method": request.method,
+        "path": request.path,
+        "endpoint": endpoint_label(),
+        "queries": count,
+        "duration_ms": round(seconds * 1000, 2),
+    }
+    budget = current_app.config["QUERY_BUDGET"]
+    if budget and count > budget:
+        logger.warning("Query budget of %s exceeded: %s", budget, json.dumps(summary))
+    else:
+        logger.debug("Queries: %s", json.dumps(summary))
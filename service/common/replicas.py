@@ -0,0 +1,135 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Read Replicas
+
+Sends the reads of GET and HEAD requests to read-only copies of the
+database, so listings do not take capacity from the writes on the primary.
+A client that has just written gets a cookie that sends its reads to the
+primary for REPLICA_READ_YOUR_WRITES seconds, long enough for the
+replicas to catch up, so it always reads its own writes. The cookie is
+also set when the catalog snapshot is enabled, for as long as the snapshot
+of another worker may still miss the write.
+"""
+import math
+import random
+from flask import request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, create_engine
+from service.common.pool import engine_options
+from service.common.snapshot import snapshot
+
+# Set on the clients that wrote during the last REPLICA_READ_YOUR_WRITES seconds
+READ_PRIMARY_COOKIE = "read_primary"
+
+# Methods whose requests never write
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class RoutingSession(Session):
+    """Session that runs the SELECTs of read requests on a replica
+
+    Writes, flushes and every other statement use the primary, as does a
+    session that has not been given a replica.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get("replica")
+        if (
+            replica is not None
+            and bind is None
+            and isinstance(clause, Select)
+            and not self._flushing
+        ):
+            return replica
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+def reads_replica(session) -> bool:
+    """Returns True when the session runs its SELECTs on a replica"""
+    return session.info.get("replica") is not None
+
+
+class Replicas:
+    """The read replicas of the database and the requests routed to them"""
+
+    def __init__(self):
+        self.engines = []
+        self.read_your_writes = 0
+        self._session = None
+
+    def init_app(self, app, session):
+        """Connects to DATABASE_REPLICA_URIS and routes the requests of the app
+
+        Args:
+            app (Flask): the application to route
+            session (scoped_session): the session of the application
+        """
+        options = app.config["SQLALCHEMY_ENGINE_OPTIONS"]
+        self.engines = [
+            create_engine(uri, **engine_options(uri, options))
+            for uri in app.config["DATABASE_REPLICA_URIS"]
+        ]
+        self.read_your_writes = app.config["REPLICA_READ_YOUR_WRITES"]
+        self._session = session
+        app.before_request(self._route_request)
+        app.after_request(self._remember_write)
+        app.teardown_request(self._end_request)
+
+    def choose(self):
+        """Returns a replica to read from, or None when there is none"""
+        return random.choice(self.engines) if self.engines else None
+
+    ######################################################################
+    #  R E Q U E S T   H O O K S
+    ######################################################################
+    def _route_request(self):
+        if request.method in READ_METHODS and not request.cookies.get(
+            READ_PRIMARY_COOKIE
+        ):
+            replica = self.choose()
+            if replica is not None:
+                self._session.info["replica"] = replica
+
+    def remember_for(self) -> int:
+        """Returns the seconds a client that wrote must read the primary"""
+        seconds = self.read_your_writes if self.engines else 0
+        if snapshot.enabled:
+            seconds = max(seconds, math.ceil(snapshot.max_age))
+        return seconds
+
+    def _remember_write(self, response):
+        seconds = self.remember_for()
+        if (
+            seconds
+            and request.method not in READ_METHODS
+            and response.status_code < 400
+        ):
+            response.set_cookie(
+                READ_PRIMARY_COOKIE,
+                "1",
+                max_age=seconds,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+    def _end_request(self, _error=None):
+        self._session.info.pop("replica", None)
+
+
+replicas = Replicas()
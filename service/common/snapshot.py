@@ -0,0 +1,196 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Catalog Snapshot
+
+Serves the unfiltered Product listing, and its first page, from a copy of
+the catalog kept in memory by each worker. A listing is encoded once, and
+compressed once per encoding, then sent as it is until the catalog changes.
+Writes made by this worker change the copy in place, and it is reloaded
+from the database once it is older than SNAPSHOT_MAX_AGE seconds, to pick
+up writes made by other workers.
+"""
+import threading
+import time
+from flask import current_app, request
+from werkzeug.http import generate_etag
+from service.common import fast_json
+from service.common.compression import COMPRESSORS, choose_encoding
+
+# Listings kept encoded at once, the full listing and first pages of any size
+RENDERINGS_MAX = 16
+
+
+class Rendering:
+    """One encoded listing and its compressed copies"""
+
+    def __init__(self, body: bytes, next_id: int = None):
+        self.body = body
+        self.etag = generate_etag(body)
+        self.next_id = next_id
+        self._encoded = {}
+
+    def encode(self, encoding: str, level: int) -> bytes:
+        """Returns the body compressed with a content coding, compressing it once"""
+        data = self._encoded.get(encoding)
+        if data is None:
+            compressor = COMPRESSORS[encoding](level)
+            data = self._encoded[encoding] = (
+                compressor.compress(self.body) + compressor.finish()
+            )
+        return data
+
+
+class CatalogSnapshot:
+    """In-memory copy of the response documents of every Product"""
+
+    def __init__(self):
+        self.enabled = False
+        self.max_age = 5.0
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._loaded_at = None
+        self._documents = {}
+        self._renderings = {}
+
+    def init_app(self, app):
+        """Enables the snapshot from the app configuration"""
+        self.enabled = app.config["SNAPSHOT_ENABLED"]
+        self.max_age = app.config["SNAPSHOT_MAX_AGE"]
+        self.invalidate()
+
+    def is_stale(self) -> bool:
+        """Returns True when the snapshot must be reloaded before use"""
+        loaded_at = self._loaded_at
+        return loaded_at is None or time.monotonic() - loaded_at > self.max_age
+
+    def age(self) -> float:
+        """Returns the seconds since the snapshot was loaded"""
+        loaded_at = self._loaded_at
+        return 0.0 if loaded_at is None else time.monotonic() - loaded_at
+
+    def invalidate(self):
+        """Forces a reload on the next listing"""
+        self._loaded_at = None
+
+    def refresh(self, documents):
+        """Reloads the snapshot when it is stale
+
+        Args:
+            documents: a function returning the response document of every
+                Product. Only one thread calls it, the others wait for it.
+        """
+        if not self.is_stale():
+            return
+        with self._load_lock:
+            if self.is_stale():
+                self.load(documents())
+
+    def load(self, documents):
+        """Replaces the snapshot with the response documents given"""
+        documents = {document["id"]: document for document in documents}
+        with self._lock:
+            self._documents = documents
+            self._changed()
+            self._loaded_at = time.monotonic()
+
+    def put(self, document: dict):
+        """Adds the response document of a Product, replacing the one it had"""
+        if not self.enabled or self.is_stale():
+            return
+        with self._lock:
+            self._documents[document["id"]] = document
+            self._changed()
+
+    def remove(self, product_id: int):
+        """Removes a Product"""
+        if not self.enabled or self.is_stale():
+            return
+        with self._lock:
+            if self._documents.pop(product_id, None) is not None:
+                self._changed()
+
+    def render(self, limit: int = None) -> tuple:
+        """Returns the encoded listing of the Products ordered by id
+
+        Args:
+            limit (int): only list the first limit Products, as a first page
+
+        :return: the rendering and the generation it belongs to
+        :rtype: tuple
+        """
+        with self._lock:
+            rendering = self._renderings.get(limit)
+            if rendering is None:
+                ids = sorted(self._documents)
+                page = ids if limit is None else ids[:limit]
+                next_id = page[-1] if len(page) < len(ids) else None
+                rendering = Rendering(
+                    fast_json.dumps([self._documents[key] for key in page]), next_id
+                )
+                if len(self._renderings) >= RENDERINGS_MAX:
+                    del self._renderings[next(iter(self._renderings))]
+                self._renderings[limit] = rendering
+            return rendering, self.generation
+
+    def response(self, limit: int = None, encode_cursor=None):
+        """Makes the response of a listing, compressed when the client accepts it
+
+        Args:
+            limit (int): only list the first limit Products, as a first page
+            encode_cursor: a function encoding the id of the last Product of a
+                first page as the X-Next-Cursor of the next one
+        """
+        config = current_app.config
+        rendering, generation = self.render(limit)
+        response = current_app.response_class(
+            rendering.body, status=200, mimetype="application/json"
+        )
+        response.headers["X-Snapshot-Generation"] = str(generation)
+        response.headers["X-Snapshot-Age"] = f"{self.age():.3f}"
+        if rendering.next_id is not None and encode_cursor:
+            response.headers["X-Next-Cursor"] = encode_cursor(rendering.next_id)
+        response.set_etag(rendering.etag)
+        response.vary.add("Accept-Encoding")
+        encoding = choose_encoding(
+            request.accept_encodings, config["COMPRESS_ALGORITHMS"]
+        )
+        if encoding and len(rendering.body) >= config["COMPRESS_MIN_SIZE"]:
+            response.set_data(
+                rendering.encode(encoding, config["COMPRESS_LEVELS"][encoding])
+            )
+            response.headers["Content-Encoding"] = encoding
+            response.set_etag(rendering.etag, weak=True)
+        return response
+
+    def stats(self) -> dict:
+        """Returns the size, generation and age of the snapshot"""
+        return {
+            "enabled": self.enabled,
+            "products": len(self._documents),
+            "generation": self.generation,
+            "age": round(self.age(), 3),
+        }
+
+    def _changed(self):
+        self._renderings = {}
+        self.generation += 1
+
+
+# Will be initialized when the app is created
+snapshot = CatalogSnapshot()
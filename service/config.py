@@ -13,7 +13,106 @@ DATABASE_URI = os.getenv(
 # Configure SQLAlchemy
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
-# SQLALCHEMY_POOL_SIZE = 2
+
+# Create the tables when the app starts. Deployments set it to false and run
+# "flask db-init" once before the workers start, so they boot without DDL
+DB_AUTO_CREATE = os.getenv("DB_AUTO_CREATE", "true").lower() in ("true", "1")
+
+# Schema migrations ("flask db-upgrade") wait at most MIGRATION_LOCK_TIMEOUT
+# for a lock before retrying, up to MIGRATION_LOCK_RETRIES times, and
+# backfill MIGRATION_BATCH_SIZE rows at a time, MIGRATION_BATCH_PAUSE apart
+MIGRATION_LOCK_TIMEOUT = os.getenv("MIGRATION_LOCK_TIMEOUT", "5s")
+MIGRATION_LOCK_RETRIES = int(os.getenv("MIGRATION_LOCK_RETRIES", "5"))
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "1000"))
+MIGRATION_BATCH_PAUSE = float(os.getenv("MIGRATION_BATCH_PAUSE", "0.1"))
+
+# Serve the Swagger UI on /apidocs. The spec itself is only built when
+# /api/swagger.json is first requested
+API_DOCS = os.getenv("API_DOCS", "true").lower() in ("true", "1")
+
+# Comma-separated URIs of read-only copies of the database. GET requests read
+# from them, except for clients that wrote in the last REPLICA_READ_YOUR_WRITES
+# seconds, which should exceed the replication lag
+DATABASE_REPLICA_URIS = [
+    uri.strip()
+    for uri in os.getenv("DATABASE_REPLICA_URIS", "").split(",")
+    if uri.strip()
+]
+REPLICA_READ_YOUR_WRITES = int(os.getenv("REPLICA_READ_YOUR_WRITES", "10"))
+
+# Connection pool of each worker. Connections are checked with a ping before
+# use and replaced after DB_POOL_RECYCLE seconds so none outlive a server
+# or proxy idle timeout
+SQLALCHEMY_ENGINE_OPTIONS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() in ("true", "1"),
+}
+
+# Statements slower than SLOW_QUERY_MS go to the slow-query log, and requests
+# issuing more than QUERY_BUDGET statements are reported (0 disables it)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "250"))
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "20"))
+
+# Keyset pagination of product listings
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "1000"))
+
+# Rows fetched per server-side batch when streaming product listings
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+
+# Changes returned per request by the change feed
+CHANGES_LIMIT_DEFAULT = int(os.getenv("CHANGES_LIMIT_DEFAULT", "1000"))
+CHANGES_LIMIT_MAX = int(os.getenv("CHANGES_LIMIT_MAX", "10000"))
+
+# Server-sent events of the ASGI service. Each worker reads the change feed
+# when PostgreSQL notifies it of a commit, unless EVENTS_LISTEN=false, and
+# every EVENTS_POLL_INTERVAL seconds. A client more than EVENTS_QUEUE_SIZE
+# changes behind is disconnected; idle streams get a comment every
+# EVENTS_HEARTBEAT seconds
+EVENTS_LISTEN = os.getenv("EVENTS_LISTEN", "true").lower() in ("true", "1")
+EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", "1"))
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "1000"))
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+
+# Rows sent per multi-row INSERT by the bulk create endpoint
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+
+# Read-through cache for single product lookups. Entries are kept per worker
+# unless CACHE_URL points at a Redis server; CACHE_MAXSIZE=0 disables it
+CACHE_URL = os.getenv("CACHE_URL", "")
+CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", "10000"))
+
+# Autocomplete of product names. AUTOCOMPLETE_INDEX=true answers it from an
+# in-process index reloaded every AUTOCOMPLETE_INDEX_TTL seconds instead of
+# querying the database on every keystroke
+AUTOCOMPLETE_LIMIT = int(os.getenv("AUTOCOMPLETE_LIMIT", "10"))
+AUTOCOMPLETE_LIMIT_MAX = int(os.getenv("AUTOCOMPLETE_LIMIT_MAX", "50"))
+AUTOCOMPLETE_INDEX = os.getenv("AUTOCOMPLETE_INDEX", "false").lower() in ("true", "1")
+AUTOCOMPLETE_INDEX_TTL = float(os.getenv("AUTOCOMPLETE_INDEX_TTL", "300"))
+
+# Serve the unfiltered product listing and its first page from an encoded
+# and compressed copy of the catalog kept by each worker. Writes of the worker
+# update it in place, writes of other workers show within SNAPSHOT_MAX_AGE seconds
+SNAPSHOT_ENABLED = os.getenv("SNAPSHOT_ENABLED", "false").lower() in ("true", "1")
+SNAPSHOT_MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", "5"))
+
+# Response compression. The first of COMPRESS_ALGORITHMS the client accepts
+# best is used for bodies of at least COMPRESS_MIN_SIZE bytes; streamed
+# listings are always compressed. Leave COMPRESS_ALGORITHMS empty to disable
+COMPRESS_ALGORITHMS = [
+    name for name in os.getenv("COMPRESS_ALGORITHMS", "zstd,br,gzip").split(",") if name
+]
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_LEVELS = {
+    "gzip": int(os.getenv("COMPRESS_LEVEL_GZIP", "6")),
+    "br": int(os.getenv("COMPRESS_LEVEL_BR", "4")),
+    "zstd": int(os.getenv("COMPRESS_LEVEL_ZSTD", "3")),
+}
+COMPRESS_MIMETYPES = ("application/json", "application/x-ndjson", "text/plain")
 
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "sup3r-s3cr3t")
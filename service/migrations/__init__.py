@@ -0,0 +1,200 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Schema Migrations
+
+Versioned changes to the database schema, applied with "flask db-upgrade".
+Every module of service/migrations/versions named <version>_<name>.py is a
+migration, summed up by the first line of its docstring, with a list of
+steps. The versions applied are recorded in the schema_migrations table.
+
+Migrations run while the service keeps serving. Indexes are built
+concurrently, large updates run in throttled batches, and a statement
+waits at most MIGRATION_LOCK_TIMEOUT for its locks before it is retried,
+rather than queueing every request behind it.
+"""
+import importlib
+import logging
+import pkgutil
+import time
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.exc import DBAPIError
+from service.models import db
+from service.migrations import versions
+from service.migrations.steps import LOCK_EFFECTS
+
+logger = logging.getLogger("flask.app")
+
+# Held while migrating, so two deployments never migrate at the same time
+ADVISORY_LOCK_ID = 2_024_021
+
+# SQLSTATE of a statement that gave up waiting for a lock
+LOCK_NOT_AVAILABLE = "55P03"
+
+schema_migrations = db.Table(
+    "schema_migrations",
+    db.Column("version", db.Integer, primary_key=True),
+    db.Column("name", db.String(100), nullable=False),
+    db.Column(
+        "applied_at",
+        db.DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+    ),
+)
+
+
+class Migration:  # pylint: disable=too-few-public-methods
+    """One versioned change to the schema"""
+
+    def __init__(self, version: int, name: str, description: str, steps: list):
+        self.version = version
+        self.name = name
+        self.description = description
+        self.steps = steps
+
+    def __repr__(self):
+        return f"<Migration {self.version:04d} {self.name}>"
+
+
+def discover() -> list:
+    """Returns every migration in service/migrations/versions, oldest first"""
+    migrations = []
+    for module_info in pkgutil.iter_modules(versions.__path__):
+        version, _, name = module_info.name.partition("_")
+        module = importlib.import_module(f"{versions.__name__}.{module_info.name}")
+        description = (module.__doc__ or name).strip().splitlines()[0]
+        migrations.append(Migration(int(version), name, description, module.steps))
+    return sorted(migrations, key=lambda migration: migration.version)
+
+
+def applied_versions(engine) -> set:
+    """Returns the versions already applied to the database"""
+    with engine.begin() as connection:
+        schema_migrations.create(connection, checkfirst=True)
+        return set(connection.scalars(select(schema_migrations.c.version)))
+
+
+def status(engine) -> list:
+    """Returns every migration with whether it has been applied"""
+    applied = applied_versions(engine)
+    return [(migration, migration.version in applied) for migration in discover()]
+
+
+def pending(engine, target: int = None) -> list:
+    """Returns the migrations still to apply, up to the target version"""
+    return [
+        migration
+        for migration, applied in status(engine)
+        if not applied and (target is None or migration.version <= target)
+    ]
+
+
+def plan(migrations: list) -> list:
+    """Returns the lines of a dry run report of the steps and their locks"""
+    lines = []
+    for migration in migrations:
+        lines.append(
+            f"{migration.version:04d} {migration.name}: {migration.description}"
+        )
+        for step in migration.steps:
+            lines.append(f"  {step.describe()}")
+            if not step.transactional:
+                lines.append("    runs outside a transaction")
+            locks = step.locks()
+            if not locks:
+                lines.append("    locks no existing table")
+            for relation, mode in locks:
+                effect = LOCK_EFFECTS.get(mode, "review this statement by hand")
+                lines.append(f"    {relation or '?'}: {mode}, {effect}")
+    return lines
+
+
+def upgrade(engine, config: dict, target: int = None) -> list:
+    """Applies the pending migrations in order, up to the target version
+
+    Every migration is recorded once all its steps have run, so one that
+    failed is run again from its first step next time.
+
+    :return: the migrations applied
+    :rtype: list
+    """
+    postgresql = engine.dialect.name == "postgresql"
+    with engine.connect() as lock:
+        lock = lock.execution_options(isolation_level="AUTOCOMMIT")
+        if postgresql:
+            lock.execute(text("SELECT pg_advisory_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+        try:
+            migrations = pending(engine, target)
+            for migration in migrations:
+                logger.info("Applying migration %r", migration)
+                for step in migration.steps:
+                    run_step(engine, step, config)
+                with engine.begin() as connection:
+                    connection.execute(
+                        insert(schema_migrations).values(
+                            version=migration.version, name=migration.name
+                        )
+                    )
+        finally:
+            if postgresql:
+                lock.execute(
+                    text("SELECT pg_advisory_unlock(:id)"), {"id": ADVISORY_LOCK_ID}
+                )
+    return migrations
+
+
+def run_step(engine, step, config: dict) -> None:
+    """Runs a step, retrying it when it gave up waiting for a lock"""
+    retries = config["MIGRATION_LOCK_RETRIES"]
+    for attempt in range(retries + 1):
+        try:
+            if step.transactional:
+                with engine.begin() as connection:
+                    set_lock_timeout(connection, config, local=True)
+                    step.run(connection, config)
+            else:
+                with engine.connect() as connection:
+                    connection = connection.execution_options(
+                        isolation_level="AUTOCOMMIT"
+                    )
+                    set_lock_timeout(connection, config, local=False)
+                    try:
+                        step.run(connection, config)
+                    finally:
+                        if connection.dialect.name == "postgresql":
+                            connection.execute(text("RESET lock_timeout"))
+            return
+        except DBAPIError as error:
+            if getattr(error.orig, "sqlstate", None) != LOCK_NOT_AVAILABLE:
+                raise
+            if attempt == retries:
+                raise
+            delay = 2**attempt
+            logger.warning(
+                "Lock not available, retrying in %ss: %s", delay, step.describe()
+            )
+            time.sleep(delay)
+
+
+def set_lock_timeout(connection, config: dict, local: bool) -> None:
+    """Bounds how long the statements of a step wait for their locks"""
+    if connection.dialect.name == "postgresql":
+        connection.execute(
+            text("SELECT set_config('lock_timeout', :timeout, :local)"),
+            {"timeout": config["MIGRATION_LOCK_TIMEOUT"], "local": local},
+        )
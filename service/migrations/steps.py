@@ -0,0 +1,347 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Migration Steps
+
+The building blocks of a migration. Every step knows how to run itself and
+which table locks it takes, so a dry run can report the locks without
+touching the database. Steps must be safe to run again, because a
+migration that fails half way is simply run again from its first step.
+"""
+import logging
+import re
+import time
+from abc import ABC, abstractmethod
+from sqlalchemy import text
+
+logger = logging.getLogger("flask.app")
+
+# What each table lock mode stops other sessions from doing
+LOCK_EFFECTS = {
+    "ACCESS EXCLUSIVE": "blocks reads and writes",
+    "EXCLUSIVE": "blocks writes",
+    "SHARE ROW EXCLUSIVE": "blocks writes",
+    "SHARE": "blocks writes",
+    "SHARE UPDATE EXCLUSIVE": "blocks schema changes and VACUUM only",
+    "ROW EXCLUSIVE": "blocks schema changes only",
+}
+
+# The lock taken by a statement, matched on its first words
+_NAME = r"(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(?:ONLY\s+)?\"?(\w+)\"?"
+STATEMENT_LOCKS = (
+    (
+        rf"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\b.*?\bON\s+{_NAME}",
+        "SHARE UPDATE EXCLUSIVE",
+    ),
+    (rf"CREATE\s+(?:UNIQUE\s+)?INDEX\b.*?\bON\s+{_NAME}", "SHARE"),
+    (rf"DROP\s+INDEX\s+CONCURRENTLY\s+{_NAME}", "SHARE UPDATE EXCLUSIVE"),
+    (rf"DROP\s+INDEX\s+{_NAME}", "ACCESS EXCLUSIVE"),
+    (rf"ALTER\s+TABLE\s+{_NAME}\s+VALIDATE\s+CONSTRAINT\b", "SHARE UPDATE EXCLUSIVE"),
+    (rf"ALTER\s+TABLE\s+{_NAME}", "ACCESS EXCLUSIVE"),
+    (rf"(?:UPDATE|INSERT\s+INTO|DELETE\s+FROM)\s+{_NAME}", "ROW EXCLUSIVE"),
+    (rf"CREATE\s+TABLE\s+{_NAME}", None),
+)
+
+
+def statement_locks(statement: str) -> list:
+    """Returns the (relation, lock mode) pairs a SQL statement takes
+
+    Creating a table locks nothing that exists yet. A statement that is not
+    recognized is reported with an unknown lock so it gets reviewed by hand.
+    """
+    for pattern, mode in STATEMENT_LOCKS:
+        match = re.match(pattern, statement.strip(), re.IGNORECASE | re.DOTALL)
+        if match:
+            return [(match.group(1), mode)] if mode else []
+    return [(None, "UNKNOWN")]
+
+
+class Step(ABC):
+    """A single change made by a migration
+
+    A step missing one of the methods below cannot be built, so it fails
+    when its migration is loaded rather than half way through an upgrade.
+    """
+
+    # Steps that cannot run inside a transaction, such as CONCURRENTLY
+    transactional = True
+
+    @abstractmethod
+    def describe(self) -> str:
+        """Returns a one line summary of the step"""
+
+    @abstractmethod
+    def locks(self) -> list:
+        """Returns the (relation, lock mode) pairs the step takes"""
+
+    @abstractmethod
+    def run(self, connection, config: dict) -> None:
+        """Applies the step on a connection
+
+        Transactional steps get a connection inside a transaction that is
+        committed when they return, the others an autocommit connection.
+        """
+
+
+class Sql(Step):
+    """Runs one SQL statement"""
+
+    def __init__(self, statement: str, transactional: bool = True):
+        self.statement = statement
+        self.transactional = transactional
+
+    def describe(self) -> str:
+        return " ".join(self.statement.split())
+
+    def locks(self) -> list:
+        return statement_locks(self.statement)
+
+    def run(self, connection, config: dict) -> None:
+        connection.execute(text(self.statement))
+
+
+class RunPython(Step):
+    """Calls a function with the connection, for changes SQL cannot express"""
+
+    def __init__(self, function, description: str, locks: tuple = ()):
+        self.function = function
+        self.description = description
+        self._locks = list(locks)
+
+    def describe(self) -> str:
+        return self.description
+
+    def locks(self) -> list:
+        return self._locks
+
+    def run(self, connection, config: dict) -> None:
+        self.function(connection)
+
+
+class CreateIndex(Step):
+    """Creates an index without blocking writes to its table
+
+    PostgreSQL builds it CONCURRENTLY, which cannot run in a transaction.
+    A concurrent build that failed leaves an invalid index behind, which
+    is dropped before building it again. Other databases build it in a
+    transaction. An index that needs a PostgreSQL extension is skipped when
+    the extension is not installed.
+    """
+
+    transactional = False
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        name,
+        table,
+        columns,
+        where=None,
+        unique=False,
+        using=None,
+        requires=None,
+    ):
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.where = where
+        self.unique = unique
+        self.using = using
+        self.requires = requires
+
+    def statement(self, concurrently: bool) -> str:
+        """Returns the CREATE INDEX statement"""
+        return " ".join(
+            part
+            for part in (
+                "CREATE UNIQUE INDEX" if self.unique else "CREATE INDEX",
+                "CONCURRENTLY" if concurrently else None,
+                f"IF NOT EXISTS {self.name} ON {self.table}",
+                f"USING {self.using}" if self.using else None,
+                f"({self.columns})",
+                f"WHERE {self.where}" if self.where else None,
+            )
+            if part
+        )
+
+    def describe(self) -> str:
+        statement = self.statement(concurrently=True)
+        if self.requires:
+            return f"{statement} (if {self.requires} is installed)"
+        return statement
+
+    def locks(self) -> list:
+        return [(self.table, "SHARE UPDATE EXCLUSIVE")]
+
+    def run(self, connection, config: dict) -> None:
+        if self.requires and not self.installed(connection):
+            logger.warning("Skipping index %s without %s", self.name, self.requires)
+            return
+        if connection.dialect.name != "postgresql":
+            connection.execute(text(self.statement(concurrently=False)))
+            return
+        invalid = connection.execute(
+            text(
+                "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = indexrelid "
+                "WHERE relname = :name AND NOT indisvalid"
+            ),
+            {"name": self.name},
+        ).first()
+        if invalid:
+            logger.warning(
+                "Dropping invalid index %s left by a failed build", self.name
+            )
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {self.name}"))
+        connection.execute(text(self.statement(concurrently=True)))
+
+    def installed(self, connection) -> bool:
+        """Returns True when the extension the index requires is installed"""
+        return (
+            connection.dialect.name == "postgresql"
+            and connection.execute(
+                text("SELECT 1 FROM pg_extension WHERE extname = :name"),
+                {"name": self.requires},
+            ).first()
+            is not None
+        )
+
+
+class Backfill(Step):
+    """Updates the rows of a large table in small batches
+
+    Each batch is its own short transaction, so row locks are held briefly
+    and the table stays writable. Rows locked by other sessions are skipped
+    and picked up by a later batch. The step pauses between batches to
+    leave room for the regular traffic, and ends when no row matches the
+    condition any more, so the assignments must make the condition false.
+    """
+
+    transactional = False
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self, table, assignments, where, key="id", batch_size=None, pause=None
+    ):
+        self.table = table
+        self.assignments = assignments
+        self.where = where
+        self.key = key
+        self.batch_size = batch_size
+        self.pause = pause
+
+    def describe(self) -> str:
+        return f"UPDATE {self.table} SET {self.assignments} WHERE {self.where} (in batches)"
+
+    def locks(self) -> list:
+        return [(self.table, "ROW EXCLUSIVE")]
+
+    def run(self, connection, config: dict) -> None:
+        batch_size = self.batch_size or config["MIGRATION_BATCH_SIZE"]
+        pause = config["MIGRATION_BATCH_PAUSE"] if self.pause is None else self.pause
+        skip_locked = (
+            " FOR UPDATE SKIP LOCKED" if connection.dialect.name == "postgresql" else ""
+        )
+        statement = text(
+            f"UPDATE {self.table} SET {self.assignments} WHERE {self.key} IN ("
+            f"SELECT {self.key} FROM {self.table} WHERE {self.where} "
+            f"LIMIT :batch_size{skip_locked})"
+        )
+        remaining = text(f"SELECT 1 FROM {self.table} WHERE {self.where} LIMIT 1")
+        total = 0
+        while True:
+            # Every batch commits on its own on the autocommit connection
+            count = connection.execute(statement, {"batch_size": batch_size}).rowcount
+            total += count
+            if count == 0 and connection.execute(remaining).first() is None:
+                break
+            logger.info("Backfilled %d rows of %s", total, self.table)
+            time.sleep(pause)
+
+
+class BackfillInsert(Step):  # pylint: disable=too-many-instance-attributes
+    """Inserts rows selected from a large table in small batches
+
+    The source table is walked in order of its key, batch_size keys at a
+    time, and each batch is its own short transaction, pausing between
+    batches like Backfill. Only the source rows matching the condition are
+    inserted, so the condition must leave out the rows already inserted
+    for the step to be safe to run again.
+    """
+
+    transactional = False
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        table,
+        columns,
+        select,
+        source,
+        where,
+        key="id",
+        batch_size=None,
+        pause=None,
+    ):
+        self.table = table
+        self.columns = columns
+        self.select = select
+        self.source = source
+        self.where = where
+        self.key = key
+        self.batch_size = batch_size
+        self.pause = pause
+
+    def describe(self) -> str:
+        return (
+            f"INSERT INTO {self.table} ({self.columns}) SELECT {self.select} "
+            f"FROM {self.source} WHERE {self.where} (in batches)"
+        )
+
+    def locks(self) -> list:
+        return [(self.table, "ROW EXCLUSIVE")]
+
+    def run(self, connection, config: dict) -> None:
+        batch_size = self.batch_size or config["MIGRATION_BATCH_SIZE"]
+        pause = config["MIGRATION_BATCH_PAUSE"] if self.pause is None else self.pause
+        statement = text(
+            f"INSERT INTO {self.table} ({self.columns}) SELECT {self.select} "
+            f"FROM {self.source} WHERE {self.key} > :after AND {self.key} <= :upto "
+            f"AND {self.where} ORDER BY {self.key}"
+        )
+        last_key = text(
+            f"SELECT max({self.key}) FROM (SELECT {self.key} FROM {self.source} "
+            f"WHERE {self.key} > :after ORDER BY {self.key} LIMIT :batch_size) batch"
+        )
+        after = connection.scalar(
+            text(f"SELECT min({self.key}) - 1 FROM {self.source}")
+        )
+        total = batches = 0
+        while after is not None:
+            upto = connection.scalar(
+                last_key, {"after": after, "batch_size": batch_size}
+            )
+            if upto is None:
+                break
+            if batches:
+                time.sleep(pause)
+            batches += 1
+            # Every batch commits on its own on the autocommit connection
+            total += connection.execute(
+                statement, {"after": after, "upto": upto}
+            ).rowcount
+            logger.info("Backfilled %d rows of %s", total, self.table)
+            after = upto
@@ -0,0 +1,22 @@
+"""Creates the product table as the first release of the service made it
+
+The statement is written out instead of generated from the models, so the
+migration does the same thing whatever the models look like today. Later
+columns, indexes and tables come from the migrations that added them.
+"""
+
+# pylint: disable=invalid-name
+
+from service.migrations.steps import Sql
+
+steps = [
+    Sql(
+        "CREATE TABLE IF NOT EXISTS product ("
+        "id serial PRIMARY KEY, "
+        "name varchar(100) NOT NULL, "
+        "description varchar(255) NOT NULL, "
+        "price numeric NOT NULL, "
+        "image_url varchar(255) NOT NULL, "
+        "available boolean NOT NULL)"
+    ),
+]
@@ -0,0 +1,14 @@
+"""Builds the Product indexes missing from tables created before them"""
+
+# pylint: disable=invalid-name
+
+from service.migrations.steps import CreateIndex
+
+steps = [
+    CreateIndex("ix_product_name", "product", "name"),
+    CreateIndex("ix_product_description", "product", "description"),
+    CreateIndex("ix_product_price", "product", "price"),
+    CreateIndex("ix_product_image_url", "product", "image_url"),
+    CreateIndex("ix_product_available_price", "product", "available, price"),
+    CreateIndex("ix_product_available_id", "product", "id", where="available IS true"),
+]
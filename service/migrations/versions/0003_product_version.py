@@ -0,0 +1,16 @@
+"""Adds the row version of Products used for ETags and optimistic locking
+
+A constant default only changes the catalog on PostgreSQL 11 and later, so
+the table is not rewritten and its lock is held for an instant.
+"""
+
+# pylint: disable=invalid-name
+
+from service.migrations.steps import Sql
+
+steps = [
+    Sql(
+        "ALTER TABLE product "
+        "ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 1"
+    ),
+]
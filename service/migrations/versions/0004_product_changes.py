@@ -0,0 +1,87 @@
+"""Records every change to the Products for the change feed
+
+The updated_at default is evaluated once, so adding the column does not
+rewrite the table. The function and the triggers recording changes are
+created in one transaction, so every kind of write is recorded from the
+same commit on. The Products that exist already are then recorded as
+inserts in batches, so replaying the feed from the start lists all of them.
+"""
+
+# pylint: disable=invalid-name,duplicate-code
+
+from sqlalchemy import text
+from service.migrations.steps import BackfillInsert, RunPython, Sql
+
+DOCUMENT = (
+    "json_build_object('_id', NULL, 'id', {row}.id, 'name', {row}.name, "
+    "'description', {row}.description, 'available', {row}.available, "
+    "'price', {row}.price, 'image_url', {row}.image_url)"
+)
+
+RECORD_CHANGES = f"""
+CREATE OR REPLACE FUNCTION record_product_changes() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO product_change (txid, product_id, operation)
+        SELECT txid_current(), id, 'delete' FROM old_rows ORDER BY id;
+    ELSE
+        INSERT INTO product_change (txid, product_id, operation, document)
+        SELECT txid_current(), id, lower(TG_OP), {DOCUMENT.format(row="new_rows")}
+        FROM new_rows ORDER BY id;
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+
+CHANGE_TRIGGERS = [
+    f"CREATE OR REPLACE TRIGGER product_{event_name.lower()}_changes "
+    f"AFTER {event_name} ON product REFERENCING {rows} TABLE AS {rows.lower()}_rows "
+    "FOR EACH STATEMENT EXECUTE FUNCTION record_product_changes()"
+    for event_name, rows in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD"))
+]
+
+
+def create_change_triggers(connection):
+    """Creates the function recording changes and the product triggers"""
+    for statement in (RECORD_CHANGES, *CHANGE_TRIGGERS):
+        connection.execute(text(statement))
+
+
+steps = [
+    Sql(
+        "ALTER TABLE product "
+        "ADD COLUMN IF NOT EXISTS updated_at timestamptz NOT NULL DEFAULT now()"
+    ),
+    Sql(
+        "CREATE TABLE IF NOT EXISTS product_change ("
+        "id bigserial PRIMARY KEY, "
+        "txid bigint NOT NULL, "
+        "product_id integer NOT NULL, "
+        "operation varchar(6) NOT NULL, "
+        "changed_at timestamptz NOT NULL DEFAULT now(), "
+        "document json)"
+    ),
+    # the table is still empty, so building its indexes blocks nothing
+    Sql(
+        "CREATE INDEX IF NOT EXISTS ix_product_change_position "
+        "ON product_change (txid, id)"
+    ),
+    Sql(
+        "CREATE INDEX IF NOT EXISTS ix_product_change_product_id "
+        "ON product_change (product_id)"
+    ),
+    RunPython(
+        create_change_triggers,
+        "create record_product_changes() and the product triggers calling it",
+        locks=(("product", "SHARE ROW EXCLUSIVE"),),
+    ),
+    BackfillInsert(
+        "product_change",
+        "txid, product_id, operation, document",
+        f"txid_current(), id, 'insert', {DOCUMENT.format(row='product')}",
+        "product",
+        "NOT EXISTS (SELECT 1 FROM product_change WHERE product_id = product.id)",
+    ),
+]
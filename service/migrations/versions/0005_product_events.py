@@ -0,0 +1,73 @@
+"""Records purchases apart from updates and notifies listeners of changes
+
+Widening a varchar does not rewrite the table. The trigger function and
+the update trigger, which now also passes the old rows, are replaced in
+one transaction, so no update runs with one but not the other.
+"""
+
+# pylint: disable=invalid-name,duplicate-code
+
+from sqlalchemy import text
+from service.migrations.steps import RunPython, Sql
+
+DOCUMENT = (
+    "json_build_object('_id', NULL, 'id', {row}.id, 'name', {row}.name, "
+    "'description', {row}.description, 'available', {row}.available, "
+    "'price', {row}.price, 'image_url', {row}.image_url)"
+)
+
+RECORD_CHANGES = f"""
+CREATE OR REPLACE FUNCTION record_product_changes() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    recorded integer;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO product_change (txid, product_id, operation)
+        SELECT txid_current(), id, 'delete' FROM old_rows ORDER BY id;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO product_change (txid, product_id, operation, document)
+        SELECT txid_current(), new_rows.id,
+            CASE WHEN old_rows.available AND NOT new_rows.available
+                AND (old_rows.name, old_rows.description, old_rows.price, old_rows.image_url)
+                IS NOT DISTINCT FROM
+                (new_rows.name, new_rows.description, new_rows.price, new_rows.image_url)
+            THEN 'purchase' ELSE 'update' END,
+            {DOCUMENT.format(row="new_rows")}
+        FROM new_rows JOIN old_rows ON old_rows.id = new_rows.id
+        ORDER BY new_rows.id;
+    ELSE
+        INSERT INTO product_change (txid, product_id, operation, document)
+        SELECT txid_current(), id, 'insert', {DOCUMENT.format(row="new_rows")}
+        FROM new_rows ORDER BY id;
+    END IF;
+    GET DIAGNOSTICS recorded = ROW_COUNT;
+    IF recorded > 0 THEN
+        PERFORM pg_notify('product_changes', '');
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+
+UPDATE_TRIGGER = (
+    "CREATE OR REPLACE TRIGGER product_update_changes "
+    "AFTER UPDATE ON product REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows "
+    "FOR EACH STATEMENT EXECUTE FUNCTION record_product_changes()"
+)
+
+
+def replace_change_triggers(connection):
+    """Replaces the function recording changes and the update trigger"""
+    connection.execute(text(RECORD_CHANGES))
+    connection.execute(text(UPDATE_TRIGGER))
+
+
+steps = [
+    Sql("ALTER TABLE product_change ALTER COLUMN operation TYPE varchar(10)"),
+    RunPython(
+        replace_change_triggers,
+        "replace record_product_changes() and the product update trigger",
+        locks=(("product", "SHARE ROW EXCLUSIVE"),),
+    ),
+]
@@ -0,0 +1,46 @@
+"""Adds the full-text search vector and the trigram index of Product names
+
+Tables created before search and autocomplete lack both. Adding the
+generated column computes it for every row, which rewrites the table
+while holding its lock, so apply this one when the catalog is quiet. Both
+GIN indexes are built concurrently. Where the pg_trgm contrib module is not
+available the trigram index is skipped and autocomplete only matches
+prefixes, as it does for tables created without it.
+"""
+
+# pylint: disable=invalid-name
+
+import logging
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from service.migrations.steps import CreateIndex, RunPython, Sql
+
+logger = logging.getLogger("flask.app")
+
+
+def install_pg_trgm(connection):
+    """Installs pg_trgm when the server has it"""
+    try:
+        with connection.begin_nested():
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except DBAPIError as error:
+        logger.warning("Autocomplete will only match prefixes: %s", error.orig)
+
+
+steps = [
+    Sql(
+        "ALTER TABLE product ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        "GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(description, '')), 'B')) STORED"
+    ),
+    CreateIndex("ix_product_search_vector", "product", "search_vector", using="GIN"),
+    RunPython(install_pg_trgm, "CREATE EXTENSION IF NOT EXISTS pg_trgm"),
+    CreateIndex(
+        "ix_product_name_trgm",
+        "product",
+        "lower(name) gin_trgm_ops",
+        using="GIN",
+        requires="pg_trgm",
+    ),
+]
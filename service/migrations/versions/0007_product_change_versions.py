@@ -0,0 +1,67 @@
+"""Records the version of the Product with every change
+
+Adding a column without a default does not rewrite the table. Changes
+recorded before have no version, and the function recording changes is
+replaced once the column exists. Deletions are recorded one version above
+the deleted row, so the versions of a Product only grow in commit order.
+"""
+
+# pylint: disable=invalid-name,duplicate-code
+
+from sqlalchemy import text
+from service.migrations.steps import RunPython, Sql
+
+DOCUMENT = (
+    "json_build_object('_id', NULL, 'id', {row}.id, 'name', {row}.name, "
+    "'description', {row}.description, 'available', {row}.available, "
+    "'price', {row}.price, 'image_url', {row}.image_url)"
+)
+
+RECORD_CHANGES = f"""
+CREATE OR REPLACE FUNCTION record_product_changes() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    recorded integer;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO product_change (txid, product_id, operation, version)
+        SELECT txid_current(), id, 'delete', version + 1 FROM old_rows ORDER BY id;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO product_change (txid, product_id, operation, version, document)
+        SELECT txid_current(), new_rows.id,
+            CASE WHEN old_rows.available AND NOT new_rows.available
+                AND (old_rows.name, old_rows.description, old_rows.price, old_rows.image_url)
+                IS NOT DISTINCT FROM
+                (new_rows.name, new_rows.description, new_rows.price, new_rows.image_url)
+            THEN 'purchase' ELSE 'update' END,
+            new_rows.version, {DOCUMENT.format(row="new_rows")}
+        FROM new_rows JOIN old_rows ON old_rows.id = new_rows.id
+        ORDER BY new_rows.id;
+    ELSE
+        INSERT INTO product_change (txid, product_id, operation, version, document)
+        SELECT txid_current(), id, 'insert', version,
+            {DOCUMENT.format(row="new_rows")}
+        FROM new_rows ORDER BY id;
+    END IF;
+    GET DIAGNOSTICS recorded = ROW_COUNT;
+    IF recorded > 0 THEN
+        PERFORM pg_notify('product_changes', '');
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+
+
+def replace_record_changes(connection):
+    """Replaces the function recording changes, the triggers stay as they are"""
+    connection.execute(text(RECORD_CHANGES))
+
+
+steps = [
+    Sql("ALTER TABLE product_change ADD COLUMN IF NOT EXISTS version integer"),
+    RunPython(
+        replace_record_changes,
+        "replace record_product_changes() to record the versions of Products",
+    ),
+]
@@ -0,0 +1,3 @@
+"""
+The migrations, one module per version
+"""
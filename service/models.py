@@ -5,20 +5,58 @@ All of the models are stored in this module
 """
 
 import logging
+import operator
+import re
+from datetime import datetime
 from decimal import Decimal
+from itertools import islice
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, and_, case, delete, event, exists, false, func, insert
+from sqlalchemy import literal, literal_column, or_, select, text, tuple_, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import aliased, make_transient_to_detached
+from sqlalchemy.orm.exc import StaleDataError
+from service.common.cache import cache
+from service.common.fast_json import product_document
+from service.common.name_index import name_index
+from service.common.replicas import RoutingSession, reads_replica
+from service.common.snapshot import snapshot
 
 
 logger = logging.getLogger("flask.app")
 
 # Create the SQLAlchemy object to be initialized later in init_db()
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 
 class DataValidationError(Exception):
     """Used for an data validation errors when deserializing"""
 
 
+class DataConflictError(Exception):
+    """Used when a record was changed by someone else since it was read"""
+
+
+# Maps each search() filter to the column it applies to and how it compares
+SEARCH_FILTERS = {
+    "name": ("name", operator.eq),
+    "description": ("description", operator.eq),
+    "price": ("price", operator.eq),
+    "price_min": ("price", operator.ge),
+    "price_max": ("price", operator.le),
+    "available": ("available", operator.eq),
+    "image_url": ("image_url", operator.eq),
+}
+
+
+# The columns a client may set on a Product
+WRITABLE_COLUMNS = ("name", "description", "price", "image_url", "available")
+
+# The columns sent in responses, in the order they are sent
+RESPONSE_FIELDS = ("id", "name", "description", "available", "price", "image_url")
+
+
+# pylint: disable=too-many-public-methods
 class Product(db.Model):
     """
     Class that represents a Product
@@ -28,11 +66,33 @@ class Product(db.Model):
     # Table Schema
     ##################################################
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    description = db.Column(db.String(255), nullable=False)
-    price = db.Column(db.Numeric(scale=2), nullable=False)
-    image_url = db.Column(db.String(255), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)
+    description = db.Column(db.String(255), nullable=False, index=True)
+    price = db.Column(db.Numeric(scale=2), nullable=False, index=True)
+    image_url = db.Column(db.String(255), nullable=False, index=True)
     available = db.Column(db.Boolean(), nullable=False, default=False)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    updated_at = db.Column(
+        db.DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+        onupdate=func.now(),
+    )
+
+    # every UPDATE checks and bumps the version it read
+    __mapper_args__ = {"version_id_col": version}
+
+    __table_args__ = (
+        # available=true&price_min=...&price_max=... listings
+        db.Index("ix_product_available_price", available, price),
+        # keyset pages of available Products only touch the available rows
+        db.Index(
+            "ix_product_available_id",
+            id,
+            postgresql_where=available.is_(True),
+            sqlite_where=available.is_(True),
+        ),
+    )
 
     def __repr__(self):
         return f"<Product {self.name} id=[{self.id}]>"
@@ -50,6 +110,8 @@ class Product(db.Model):
             db.session.rollback()
             logger.error("Error creating record: %s", self)
             raise DataValidationError(e) from e
+        name_index.add(self.id, self.name)
+        snapshot.put(product_document(self))
 
     def update(self) -> None:
         """
@@ -58,23 +120,76 @@ class Product(db.Model):
         logger.info("Saving %s", self.name)
         if not self.id:
             raise DataValidationError("Update called with empty ID field")
+        key = parse_id(self.id)
         try:
             db.session.commit()
+        except StaleDataError as e:
+            db.session.rollback()
+            cache.delete(key)
+            logger.warning("Conflict updating record: %s", key)
+            raise DataConflictError(
+                f"Product with id [{key}] was changed by another request"
+            ) from e
         except Exception as e:
             db.session.rollback()
             logger.error("Error updating record: %s", self)
             raise DataValidationError(e) from e
+        cache.delete(key)
+        name_index.add(key, self.name)
+        snapshot.put(product_document(self))
 
     def delete(self) -> None:
         """Removes a ProductModel from the data store"""
         logger.info("Deleting %s", self.name)
+        key = parse_id(self.id)
         try:
             db.session.delete(self)
             db.session.commit()
+        except StaleDataError as e:
+            # Another request changed or deleted the row since it was read
+            db.session.rollback()
+            cache.delete(key)
+            if db.session.get(Product, key, populate_existing=True) is not None:
+                logger.warning("Conflict deleting record: %s", key)
+                raise DataConflictError(
+                    f"Product with id [{key}] was changed by another request"
+                ) from e
         except Exception as e:
             db.session.rollback()
             logger.error("Error deleting record: %s", self)
             raise DataValidationError(e) from e
+        cache.delete(key)
+        name_index.remove(key)
+        snapshot.remove(key)
+
+    def etag(self) -> str:
+        """Returns a strong entity tag that changes with every update"""
+        return f"{self.id}-{self.version}"
+
+    def column_values(self) -> dict:
+        """Returns the value of every column, as kept in the cache
+
+        The values are plain JSON types, the price and the update time are
+        kept as strings, so any cache backend can store them as JSON.
+        """
+        values = {
+            column.key: getattr(self, column.key) for column in self.__table__.columns
+        }
+        values["price"] = str(self.price)
+        values["updated_at"] = self.updated_at and self.updated_at.isoformat()
+        return values
+
+    @classmethod
+    def from_column_values(cls, values: dict):
+        """Makes a Product from the values returned by column_values()"""
+        updated_at = values["updated_at"]
+        return cls(
+            **{
+                **values,
+                "price": Decimal(values["price"]),
+                "updated_at": updated_at and datetime.fromisoformat(updated_at),
+            }
+        )
 
     def serialize(self) -> dict:
         """Serializes a Product into a dictionary"""
@@ -94,10 +209,10 @@ class Product(db.Model):
             data (dict): A dictionary containing the Product data
         """
         try:
-            self.name = data["name"]
-            self.description = data["description"]
+            self.name = check_string("name", data["name"])
+            self.description = check_string("description", data["description"])
             self.price = round(Decimal(data["price"]), 2)
-            self.image_url = data["image_url"]
+            self.image_url = check_string("image_url", data["image_url"])
 
             # Add validation for available field
             if not isinstance(data["available"], bool):
@@ -122,17 +237,368 @@ class Product(db.Model):
     # CLASS METHODS
     ##################################################
 
+    @classmethod
+    def deserialize_changes(cls, data: dict) -> dict:
+        """
+        Deserializes a partial Product used to update many Products at once
+        Args:
+            data (dict): A dictionary with some of the writable Product fields
+        """
+        if not isinstance(data, dict) or not data:
+            raise DataValidationError(
+                "Invalid changes: body must contain fields to update"
+            )
+        unknown = sorted(set(data) - set(WRITABLE_COLUMNS))
+        if unknown:
+            raise DataValidationError(f"Invalid changes: unknown fields {unknown}")
+        changes = dict(data)
+        if "price" in changes:
+            try:
+                changes["price"] = round(Decimal(changes["price"]), 2)
+            except (ArithmeticError, TypeError, ValueError) as error:
+                raise DataValidationError(
+                    f"Invalid price: {changes['price']}"
+                ) from error
+        if "available" in changes and not isinstance(changes["available"], bool):
+            raise DataValidationError(
+                "Invalid type for boolean [available]: "
+                + str(type(changes["available"]))
+            )
+        for column in ("name", "description", "image_url"):
+            if column in changes:
+                check_string(column, changes[column])
+        return changes
+
+    @classmethod
+    def update_many(cls, query, changes: dict) -> int:
+        """
+        Updates every Product matched by a query with one UPDATE statement
+
+        :return: the number of Products updated
+        :rtype: int
+        """
+        logger.info("Updating Products in bulk with %s", changes)
+        try:
+            # bumping the version changes the ETags and fails writes that
+            # started from the rows as they were before
+            count = query.update(
+                {**changes, "version": cls.version + 1}, synchronize_session=False
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error updating records in bulk: %s", e)
+            raise DataValidationError(e) from e
+        cache.clear()
+        if "name" in changes:
+            name_index.invalidate()
+        snapshot.invalidate()
+        logger.info("Updated %s Products", count)
+        return count
+
+    @classmethod
+    def delete_many(cls, query) -> int:
+        """
+        Deletes every Product matched by a query with one DELETE statement
+
+        :return: the number of Products deleted
+        :rtype: int
+        """
+        logger.info("Deleting Products in bulk")
+        try:
+            count = query.delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error deleting records in bulk: %s", e)
+            raise DataValidationError(e) from e
+        cache.clear()
+        name_index.invalidate()
+        snapshot.invalidate()
+        logger.info("Deleted %s Products", count)
+        return count
+
+    @classmethod
+    def remove_all(cls) -> int:
+        """Removes all Products from the database"""
+        return cls.delete_many(cls.query)
+
+    @classmethod
+    def create_many(cls, products, chunk_size: int) -> list:
+        """
+        Creates many Products in a single transaction
+
+        The Products are sent chunk_size rows at a time as multi-row INSERTs
+        and committed once at the end, so either all of them are created or
+        none are.
+
+        Args:
+            products: an iterable of deserialized Products
+            chunk_size (int): the number of rows sent per INSERT
+
+        :return: the ids of the new Products in the order they were given
+        :rtype: list
+        """
+        logger.info("Creating Products in chunks of %s", chunk_size)
+        statement = insert(cls).returning(cls.id, sort_by_parameter_order=True)
+        products = iter(products)
+        ids, names = [], []
+        try:
+            while chunk := list(islice(products, chunk_size)):
+                rows = [
+                    {column: getattr(product, column) for column in WRITABLE_COLUMNS}
+                    for product in chunk
+                ]
+                ids.extend(db.session.scalars(statement, rows).all())
+                names.extend(row["name"] for row in rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error creating records in bulk: %s", e)
+            raise DataValidationError(e) from e
+        for product_id, name in zip(ids, names):
+            name_index.add(product_id, name)
+        snapshot.invalidate()
+        logger.info("Created %s Products", len(ids))
+        return ids
+
     @classmethod
     def all(cls):
         """Returns all of the Products in the database"""
         logger.info("Processing all Products")
         return cls.query.all()
 
+    @classmethod
+    def search(cls, **filters):
+        """Returns all Products that match every one of the given filters
+
+        Filters whose value is None are ignored, so the remaining ones are
+        ANDed together into a single query.
+
+        Args:
+            filters: any of name, description, price, price_min, price_max,
+                available and image_url
+        """
+        logger.info("Processing search query for %s ...", filters)
+        return cls.query.filter(*cls.search_criteria(**filters))
+
+    @classmethod
+    def search_criteria(cls, **filters) -> list:
+        """Builds the SQL criteria for the filters accepted by search()"""
+        criteria = []
+        for key, value in filters.items():
+            if key not in SEARCH_FILTERS:
+                raise DataValidationError(f"Invalid filter: {key}")
+            if value is None:
+                continue
+            column, compare = SEARCH_FILTERS[key]
+            if column == "available" and not isinstance(value, bool):
+                raise TypeError("Invalid availability, must be of type boolean")
+            criteria.append(compare(getattr(cls, column), value))
+        return criteria
+
+    @classmethod
+    def response_columns(cls, query, fields=None):
+        """Narrows a Product query to the columns sent in responses
+
+        The rows come back as named tuples, which skips building a Product
+        for every row of a listing.
+
+        Args:
+            query: the Product query to narrow
+            fields (list): only select these RESPONSE_FIELDS, and the id that
+                pages are keyed on, instead of all of them
+        """
+        return query.with_entities(*cls.response_column_list(fields))
+
+    @classmethod
+    def response_column_list(cls, fields=None) -> list:
+        """Returns the columns selected by response_columns()"""
+        names = RESPONSE_FIELDS if fields is None else ("id", *fields)
+        return [getattr(cls, name) for name in dict.fromkeys(names)]
+
+    @classmethod
+    def find_page(cls, query, limit: int, after_id: int = None) -> tuple:
+        """Returns one keyset page of Products ordered by id
+
+        Args:
+            query: the Product query to page through
+            limit (int): the maximum number of Products on the page
+            after_id (int): only return Products with an id greater than this
+
+        :return: the Products on the page and whether more Products follow
+        :rtype: tuple
+        """
+        logger.info("Processing page query after id %s (limit %s) ...", after_id, limit)
+        if after_id is not None:
+            query = query.filter(cls.id > after_id)
+        products = query.order_by(cls.id).limit(limit + 1).all()
+        return products[:limit], len(products) > limit
+
+    @classmethod
+    def search_text(cls, terms: str, dialect: str = None):
+        """Returns the query for Products matching the search terms, best first
+
+        PostgreSQL matches the terms against the search_vector column and
+        ranks them with ts_rank_cd, name matches weighing more. Other
+        databases fall back to a case-insensitive substring match on every
+        term, ranking Products whose name matches ahead of the rest.
+
+        Args:
+            terms (str): the words to search for
+            dialect (str): the database dialect, by default the one in use
+        """
+        logger.info("Processing text search for %s ...", terms)
+        dialect = dialect or db.session.get_bind().dialect.name
+        if dialect == "postgresql":
+            vector = literal_column("search_vector")
+            tsquery = func.websearch_to_tsquery("english", terms)
+            return cls.query.filter(vector.op("@@")(tsquery)).order_by(
+                func.ts_rank_cd(vector, tsquery).desc(), cls.id
+            )
+
+        words = terms.split()
+        if not words:
+            return cls.query.filter(false())
+        in_name = [cls.name.icontains(word, autoescape=True) for word in words]
+        query = cls.query
+        for word, name_match in zip(words, in_name):
+            query = query.filter(
+                name_match | cls.description.icontains(word, autoescape=True)
+            )
+        return query.order_by(case((and_(*in_name), 0), else_=1), cls.id)
+
+    @classmethod
+    def autocomplete(cls, typed: str, limit: int) -> list:
+        """Returns up to limit (id, name) pairs for a partially typed name
+
+        Names starting with the typed text come first. With the in-process
+        name index, or with pg_trgm on PostgreSQL, they are followed by the
+        names most similar to it, so typos still find a match.
+
+        Args:
+            typed (str): the start of a Product name as typed so far
+            limit (int): the maximum number of names returned
+        """
+        logger.info("Processing autocomplete for %s ...", typed)
+        if name_index.enabled:
+            if name_index.is_stale():
+                name_index.load(db.session.execute(select(cls.id, cls.name)).all())
+            return name_index.complete(typed, limit)
+
+        key = func.lower(cls.name)
+        pattern = re.sub(r"([/%_])", r"/\1", typed.lower()) + "%"
+        is_prefix = key.like(pattern, escape="/")
+        query = db.session.query(cls.id, cls.name)
+        if has_trigram_index():
+            similar = literal(typed.lower()).op("<%")(key)
+            query = query.filter(or_(is_prefix, similar)).order_by(
+                is_prefix.desc(), func.word_similarity(typed.lower(), key).desc()
+            )
+        else:
+            query = query.filter(is_prefix)
+        return [tuple(row) for row in query.order_by(key, cls.id).limit(limit)]
+
+    @classmethod
+    def find_ranked_page(cls, query, limit: int, offset: int = 0) -> tuple:
+        """Returns one page of an ordered Product query
+
+        Ranked results have no stable key to page on, so the page starts
+        after the first offset results.
+
+        :return: the Products on the page and whether more Products follow
+        :rtype: tuple
+        """
+        logger.info("Processing page query at offset %s (limit %s) ...", offset, limit)
+        products = query.offset(offset).limit(limit + 1).all()
+        return products[:limit], len(products) > limit
+
+    @classmethod
+    def stream(cls, query, batch_size: int):
+        """Returns a query that fetches its Products batch_size rows at a time
+
+        Args:
+            query: the Product query to stream
+            batch_size (int): the number of rows fetched per round trip
+        """
+        logger.info("Processing streamed query in batches of %s ...", batch_size)
+        return query.yield_per(batch_size)
+
     @classmethod
     def find(cls, by_id):
-        """Finds a Product by it's ID"""
+        """Finds a Product by it's ID
+
+        Lookups are served from the cache when possible. A cached Product is
+        merged into the session without a query, so it can still be updated
+        or deleted like one loaded from the database. Only Products read
+        from the primary are cached, as a replica may still return one that
+        was just changed.
+        """
         logger.info("Processing lookup for id %s ...", by_id)
-        return cls.query.session.get(cls, by_id)
+        key = parse_id(by_id)
+        if key is None:
+            return None
+        values = cache.get(key)
+        if values is not None:
+            product = cls.from_column_values(values)
+            make_transient_to_detached(product)
+            return db.session.merge(product, load=False)
+        product = cls.query.session.get(cls, key)
+        if product and not reads_replica(db.session):
+            cache.set(key, product.column_values())
+        return product
+
+    @classmethod
+    def find_for_update(cls, by_id):
+        """Finds a Product by it's ID as it is stored now, to change it
+
+        The cache and the session may hold an older version of the Product,
+        written by another worker or the ASGI service since, and an update
+        or a delete starting from it would fail the version check.
+        """
+        logger.info("Processing lookup for update of id %s ...", by_id)
+        key = parse_id(by_id)
+        if key is None:
+            return None
+        return db.session.get(cls, key, populate_existing=True)
+
+    @classmethod
+    def purchase(cls, by_id):
+        """
+        Purchases an available Product with one conditional UPDATE
+
+        The availability check and the write happen in the same statement,
+        so two concurrent buyers can never both purchase the same Product.
+
+        :return: the purchased Product, or None if it was not available
+        """
+        logger.info("Processing purchase for id %s ...", by_id)
+        key = parse_id(by_id)
+        if key is None:
+            return None
+        try:
+            row = db.session.execute(cls.purchase_statement(key)).first()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error purchasing record: %s", key)
+            raise DataValidationError(e) from e
+        if row is None:
+            return None
+        cache.delete(key)
+        product = cls(**row._mapping)
+        snapshot.put(product_document(product))
+        return product
+
+    @classmethod
+    def purchase_statement(cls, key: int):
+        """Returns the UPDATE that purchases a Product only if it is available"""
+        return (
+            update(cls)
+            .where(cls.id == key, cls.available.is_(True))
+            .values(available=False, version=cls.version + 1)
+            .returning(*cls.__table__.columns)
+        )
 
     @classmethod
     def find_by_name(cls, name):
@@ -177,3 +643,271 @@ class Product(db.Model):
         """Returns all Products with the given image URL"""
         logger.info("Processing image URL query for %s ...", price)
         return cls.query.filter(cls.price == price)
+
+
+# The search vector is a PostgreSQL generated column, so it is added after
+# the table is created instead of being mapped. Only search_text() reads it.
+# Words in the name weigh more than words in the description.
+for _statement in (
+    "ALTER TABLE %(table)s ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')) STORED",
+    "CREATE INDEX ix_%(table)s_search_vector ON %(table)s USING GIN (search_vector)",
+):
+    event.listen(
+        Product.__table__,
+        "after_create",
+        DDL(_statement).execute_if(dialect="postgresql"),
+    )
+
+
+@event.listens_for(Product.__table__, "after_create")
+def create_trigram_index(target, connection, **_kwargs):
+    """Indexes the lowercase names for autocomplete when pg_trgm is available"""
+    if connection.dialect.name != "postgresql":
+        return
+    try:
+        with connection.begin_nested():
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            connection.execute(
+                text(
+                    f"CREATE INDEX ix_{target.name}_name_trgm ON {target.name} "
+                    "USING GIN (lower(name) gin_trgm_ops)"
+                )
+            )
+    except DBAPIError as error:
+        logger.warning("Autocomplete will only match prefixes: %s", error.orig)
+
+
+######################################################################
+#  C H A N G E   F E E D
+######################################################################
+class ProductChange(db.Model):
+    """
+    A change to a Product, recorded by triggers on the product table
+
+    Changes are ordered by the id of the transaction that made them, then
+    by their own id. A change is only listed once every transaction with a
+    lower id has ended, so no change ever appears before one already
+    listed, and a consumer can resume from the last change it has seen.
+    Transaction ids are assigned at the first write, not at commit, so two
+    changes of a Product can be listed out of order. Their versions are in
+    commit order, so consumers drop a change older than one they applied.
+    """
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    txid = db.Column(db.BigInteger, nullable=False)
+    product_id = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(10), nullable=False)
+    # the version of the Product after the change, one more for a deletion
+    version = db.Column(db.Integer)
+    changed_at = db.Column(
+        db.DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    # the response document of the Product, None for a deletion (tombstone)
+    document = db.Column(db.JSON)
+
+    __table_args__ = (
+        db.Index("ix_product_change_position", txid, id),
+        db.Index("ix_product_change_product_id", product_id),
+    )
+
+    def __repr__(self):
+        return f"<ProductChange {self.operation} id=[{self.product_id}]>"
+
+    def serialize(self) -> dict:
+        """Serializes a ProductChange into a dictionary, without its token"""
+        return {
+            "operation": self.operation,
+            "id": self.product_id,
+            "version": self.version,
+            "changed_at": self.changed_at,
+            "product": self.document,
+        }
+
+    @classmethod
+    def after(cls, txid: int, change_id: int, limit: int) -> tuple:
+        """Returns the changes listed after a position, in order
+
+        Args:
+            txid (int): the transaction id of the last change seen
+            change_id (int): the id of the last change seen
+            limit (int): the maximum number of changes returned
+
+        :return: the changes and the lowest transaction id still running
+        :rtype: tuple
+        """
+        logger.info("Processing changes after %s.%s ...", txid, change_id)
+        horizon = db.session.scalar(cls.horizon_statement())
+        changes = db.session.scalars(
+            cls.after_statement((txid, change_id), horizon, limit)
+        ).all()
+        return changes, horizon
+
+    @staticmethod
+    def recorded(dialect: str) -> bool:
+        """Returns True when a database of the dialect records changes
+
+        Only PostgreSQL has the triggers filling the product_change table.
+        """
+        return dialect == "postgresql"
+
+    @staticmethod
+    def horizon_statement():
+        """Returns a query of the lowest transaction id still running"""
+        return select(func.txid_snapshot_xmin(func.txid_current_snapshot()))
+
+    @classmethod
+    def after_statement(
+        cls, position: tuple, horizon: int, limit: int, product_ids=None
+    ):
+        """Returns a query of the changes listed after a (txid, id) position
+
+        Only the changes of transactions older than the horizon are listed,
+        and only those of the Products in product_ids when it is given.
+        """
+        statement = select(cls).where(
+            tuple_(cls.txid, cls.id) > tuple_(*position),
+            cls.txid < horizon,
+        )
+        if product_ids:
+            statement = statement.where(cls.product_id.in_(product_ids))
+        return statement.order_by(cls.txid, cls.id).limit(limit)
+
+    @classmethod
+    def compact(cls) -> int:
+        """Removes every change superseded by a later version of the same Product
+
+        Replaying what is left still gives every Product as it is now, and
+        the deletions, so consumers can start from the beginning at any time.
+
+        :return: the number of changes removed
+        :rtype: int
+        """
+        logger.info("Compacting the Product changes")
+        later = aliased(cls)
+        # changes recorded without a version are ordered by their position
+        statement = delete(cls).where(
+            exists().where(
+                later.product_id == cls.product_id,
+                tuple_(func.coalesce(later.version, 0), later.txid, later.id)
+                > tuple_(func.coalesce(cls.version, 0), cls.txid, cls.id),
+            )
+        )
+        try:
+            count = db.session.execute(statement).rowcount
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error compacting changes: %s", e)
+            raise DataValidationError(e) from e
+        logger.info("Compacted %s changes", count)
+        return count
+
+
+# The response document of a row, built by the database
+CHANGE_DOCUMENT = (
+    "json_build_object('_id', NULL, 'id', {row}.id, 'name', {row}.name, "
+    "'description', {row}.description, 'available', {row}.available, "
+    "'price', {row}.price, 'image_url', {row}.image_url)"
+)
+
+# Every statement writing Products records its rows, in the same transaction,
+# and notifies the listeners of CHANGES_CHANNEL when it commits. An update
+# that only makes available Products unavailable is recorded as a purchase
+CHANGES_CHANNEL = "product_changes"
+RECORD_CHANGES = f"""
+CREATE OR REPLACE FUNCTION record_product_changes() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    recorded integer;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO product_change (txid, product_id, operation, version)
+        SELECT txid_current(), id, 'delete', version + 1 FROM old_rows ORDER BY id;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO product_change (txid, product_id, operation, version, document)
+        SELECT txid_current(), new_rows.id,
+            CASE WHEN old_rows.available AND NOT new_rows.available
+                AND (old_rows.name, old_rows.description, old_rows.price, old_rows.image_url)
+                IS NOT DISTINCT FROM
+                (new_rows.name, new_rows.description, new_rows.price, new_rows.image_url)
+            THEN 'purchase' ELSE 'update' END,
+            new_rows.version, {CHANGE_DOCUMENT.format(row="new_rows")}
+        FROM new_rows JOIN old_rows ON old_rows.id = new_rows.id
+        ORDER BY new_rows.id;
+    ELSE
+        INSERT INTO product_change (txid, product_id, operation, version, document)
+        SELECT txid_current(), id, 'insert', version,
+            {CHANGE_DOCUMENT.format(row="new_rows")}
+        FROM new_rows ORDER BY id;
+    END IF;
+    GET DIAGNOSTICS recorded = ROW_COUNT;
+    IF recorded > 0 THEN
+        PERFORM pg_notify('{CHANGES_CHANNEL}', '');
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+CHANGE_TRIGGERS = {
+    event_name: (
+        f"CREATE OR REPLACE TRIGGER product_{event_name.lower()}_changes "
+        f"AFTER {event_name} ON product REFERENCING {tables} "
+        "FOR EACH STATEMENT EXECUTE FUNCTION record_product_changes()"
+    )
+    for event_name, tables in (
+        ("INSERT", "NEW TABLE AS new_rows"),
+        ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+        ("DELETE", "OLD TABLE AS old_rows"),
+    )
+}
+ProductChange.__table__.add_is_dependent_on(Product.__table__)
+for _statement in (RECORD_CHANGES, *CHANGE_TRIGGERS.values()):
+    event.listen(
+        ProductChange.__table__,
+        "after_create",
+        DDL(_statement).execute_if(dialect="postgresql"),
+    )
+
+
+######################################################################
+#  U T I L I T Y   F U N C T I O N S
+######################################################################
+def check_string(column: str, value):
+    """Returns the value of a string column if it is a string that fits it
+
+    Checking the length here reports a value that is too long as invalid
+    data, instead of failing the whole statement at the database.
+    """
+    if not isinstance(value, str):
+        raise DataValidationError(f"Invalid type for string [{column}]")
+    length = Product.__table__.columns[column].type.length
+    if len(value) > length:
+        raise DataValidationError(f"Invalid {column}: longer than {length} characters")
+    return value
+
+
+def parse_id(by_id):
+    """Returns a Product id as an integer, or None if it is not one"""
+    try:
+        return int(by_id)
+    except (TypeError, ValueError):
+        return None
+
+
+# Whether pg_trgm is installed, by database URL
+_trigram_support = {}
+
+
+def has_trigram_index() -> bool:
+    """Returns True when pg_trgm is installed in the database in use"""
+    bind = db.session.get_bind()
+    if bind.url not in _trigram_support:
+        _trigram_support[bind.url] = bind.dialect.name == "postgresql" and (
+            db.session.execute(
+                text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            ).first()
+            is not None
+        )
+    return _trigram_support[bind.url]
@@ -25,19 +25,49 @@ Product Store Service with Swagger
 Paths:
 ------
 GET / - Displays a UI for Selenium testing
+GET /metrics - Returns Prometheus metrics aggregated across workers
+GET /stats - Returns the runtime statistics of this worker
 GET /products - Returns a list all of the Products
+GET /products?limit={n}&cursor={token} - Returns one page of Products
+GET /products?available=true&price_max={n} - Returns Products matching all filters
+GET /products?stream=json|ndjson - Streams the Products in server-side batches
+GET /products?fields=id,name,price - Returns only the given fields of the Products
+GET /products/search?q={terms} - Returns the Products matching the terms, best first
+GET /products/autocomplete?q={text} - Returns the Product names completing the text
 GET /products/{id} - Returns the Product with a given id number
 POST /products - creates a new Product record in the database
+POST /products/bulk - creates many Product records in a single transaction
+PATCH /products - updates every Product matching the ids and filters given
+DELETE /products - deletes every Product matching the ids and filters given
 PUT /products/{id} - updates a Product record in the database
 DELETE /products/{id} - deletes a Product record in the database
 """
 
+import os
+import json
 from decimal import Decimal
 from flask import current_app as app  # Import Flask application
-from flask import jsonify
-from flask_restx import Resource, fields, reqparse, inputs
-from service.models import Product
+from flask import Response, jsonify, request, stream_with_context
+from flask_restx import Resource, fields, reqparse, inputs, marshal
+from prometheus_client import CONTENT_TYPE_LATEST
+from werkzeug.http import quote_etag
+from service.models import (
+    Product,
+    ProductChange,
+    DataValidationError,
+    SEARCH_FILTERS,
+    db,
+)
 from service.common import status  # HTTP Status Codes
+from service.common import fast_json, metrics
+from service.common.fast_json import product_document
+from service.common.cache import cache
+from service.common.pool import pool_stats
+from service.common.replicas import READ_PRIMARY_COOKIE, replicas
+from service.common.snapshot import snapshot
+from service.common.query_args import decode_cursor, encode_cursor, field_list
+from service.common.query_args import INTEGER_MAX
+from service.common.query_args import decode_change_token, encode_change_token
 from . import api
 
 
@@ -60,6 +90,52 @@ def health_check():
     return jsonify(status=200, message="Healthy"), status.HTTP_200_OK
 
 
+######################################################################
+# CONDITIONAL GET SUPPORT
+######################################################################
+@app.after_request
+def conditional_get(response):
+    """Adds a strong ETag to API reads and answers If-None-Match with 304"""
+    if (
+        request.method == "GET"
+        and request.path.startswith(api.prefix)
+        and response.status_code == status.HTTP_200_OK
+        and not response.is_streamed
+    ):
+        # Keep an ETag set by the resource, hash the body otherwise
+        if response.get_etag()[0] is None:
+            response.add_etag()
+        response.make_conditional(request)
+    return response
+
+
+######################################################################
+# GET PROMETHEUS METRICS
+######################################################################
+@app.route("/metrics", methods=["GET"])
+def export_metrics():
+    """Returns the request and query metrics of every worker"""
+    return Response(metrics.export(), mimetype=CONTENT_TYPE_LATEST)
+
+
+######################################################################
+# GET WORKER STATISTICS
+######################################################################
+@app.route("/stats", methods=["GET"])
+def worker_stats():
+    """Returns the runtime statistics of the worker serving the request"""
+    return (
+        jsonify(
+            pid=os.getpid(),
+            cache=cache.stats(),
+            pool=pool_stats(db.engine.pool),
+            replica_pools=[pool_stats(engine.pool) for engine in replicas.engines],
+            snapshot=snapshot.stats(),
+        ),
+        status.HTTP_200_OK,
+    )
+
+
 create_model = api.model(
     "Product",
     {
@@ -79,6 +155,27 @@ create_model = api.model(
     },
 )
 
+bulk_update_model = api.model(
+    "BulkUpdate",
+    {
+        "ids": fields.List(
+            fields.Integer, required=False, description="IDs of the Products to update"
+        ),
+        "changes": fields.Raw(
+            required=True, description="The Product fields to set on every match"
+        ),
+    },
+)
+
+bulk_delete_model = api.model(
+    "BulkDelete",
+    {
+        "ids": fields.List(
+            fields.Integer, required=False, description="IDs of the Products to delete"
+        ),
+    },
+)
+
 product_model = api.inherit(
     "ProductModel",
     create_model,
@@ -89,32 +186,153 @@ product_model = api.inherit(
     },
 )
 
-# query string arguments
-product_args = reqparse.RequestParser()
-product_args.add_argument(
+autocomplete_model = api.model(
+    "ProductName",
+    {
+        "id": fields.Integer(description="ID of the product"),
+        "name": fields.String(description="The name of the product"),
+    },
+)
+
+
+# query string filters, the only arguments of bulk updates and deletes
+filter_args = reqparse.RequestParser()
+filter_args.add_argument(
     "name", type=str, location="args", required=False, help="List Products by name"
 )
-product_args.add_argument(
+filter_args.add_argument(
     "description",
     type=str,
     location="args",
     required=False,
     help="List Products by category",
 )
-product_args.add_argument(
+filter_args.add_argument(
     "available",
     type=inputs.boolean,
     location="args",
     required=False,
     help="List Products by availability",
 )
-product_args.add_argument(
+filter_args.add_argument(
     "price",
     type=Decimal,
     location="args",
     required=False,
     help="List Products by price",
 )
+filter_args.add_argument(
+    "price_min",
+    type=Decimal,
+    location="args",
+    required=False,
+    help="List Products with at least this price",
+)
+filter_args.add_argument(
+    "price_max",
+    type=Decimal,
+    location="args",
+    required=False,
+    help="List Products with at most this price",
+)
+filter_args.add_argument(
+    "image_url",
+    type=str,
+    location="args",
+    required=False,
+    help="List Products by image URL",
+)
+
+# query string arguments of the listing
+product_args = filter_args.copy()
+product_args.add_argument(
+    "limit",
+    type=inputs.int_range(1, app.config["PAGE_SIZE_MAX"]),
+    location="args",
+    required=False,
+    help="Maximum number of Products per page",
+)
+product_args.add_argument(
+    "cursor",
+    type=str,
+    location="args",
+    required=False,
+    help="Opaque cursor from the X-Next-Cursor header of the previous page",
+)
+product_args.add_argument(
+    "fields",
+    type=field_list,
+    location="args",
+    required=False,
+    help="Comma separated fields to return, e.g. id,name,price,image_url",
+)
+product_args.add_argument(
+    "stream",
+    type=str,
+    choices=("json", "ndjson"),
+    location="args",
+    required=False,
+    help="Stream the Products as a JSON array or as newline delimited JSON",
+)
+
+# query string arguments of the text search
+search_args = reqparse.RequestParser()
+search_args.add_argument(
+    "q",
+    type=inputs.regex(r"\S"),
+    location="args",
+    required=True,
+    help="Words to search for in the name and description of the Products",
+)
+search_args.add_argument(
+    "limit",
+    type=inputs.int_range(1, app.config["PAGE_SIZE_MAX"]),
+    location="args",
+    required=False,
+    help="Maximum number of Products per page",
+)
+search_args.add_argument(
+    "cursor",
+    type=str,
+    location="args",
+    required=False,
+    help="Opaque cursor from the X-Next-Cursor header of the previous page",
+)
+
+# query string arguments of the autocomplete
+autocomplete_args = reqparse.RequestParser()
+autocomplete_args.add_argument(
+    "q",
+    type=inputs.regex(r"\S"),
+    location="args",
+    required=True,
+    help="The start of a Product name as typed so far",
+)
+autocomplete_args.add_argument(
+    "limit",
+    type=inputs.int_range(1, app.config["AUTOCOMPLETE_LIMIT_MAX"]),
+    location="args",
+    required=False,
+    help="Maximum number of names returned",
+)
+
+
+# query string arguments of the change feed
+changes_args = reqparse.RequestParser()
+changes_args.add_argument(
+    "since",
+    type=str,
+    location="args",
+    required=False,
+    help="Token of the last change seen, or nothing to start from the beginning",
+)
+changes_args.add_argument(
+    "limit",
+    type=inputs.int_range(1, app.config["CHANGES_LIMIT_MAX"]),
+    location="args",
+    required=False,
+    help="Maximum number of changes returned",
+)
 
 
 ######################################################################
@@ -137,7 +355,8 @@ class ProductResource(Resource):
     # ------------------------------------------------------------------
     @api.doc("get_products")
     @api.response(404, "Product not found")
-    @api.marshal_with(product_model)
+    @api.response(304, "Product not modified")
+    @api.response(200, "Success", product_model)
     def get(self, product_id):
         """
         Retrieve a single Product
@@ -153,8 +372,19 @@ class ProductResource(Resource):
                 f"Product with id '{product_id}' was not found.",
             )
 
+        # The ETag comes from the row version, so an unchanged Product is
+        # answered without serializing it
+        etag = product.etag()
+        if request.if_none_match.contains_weak(etag):
+            app.logger.info("Product with id [%s] not modified", product_id)
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": quote_etag(etag)}
+            )
+
         app.logger.info("Returning product: %s", product.name)
-        return product.serialize(), status.HTTP_200_OK
+        return fast_json.output_json(
+            product_document(product), status.HTTP_200_OK, {"ETag": quote_etag(etag)}
+        )
 
     ######################################################################
     # UPDATE AN EXISTING PRODUCT
@@ -162,38 +392,55 @@ class ProductResource(Resource):
     @api.doc("update_products")
     @api.response(404, "Product not found")
     @api.response(400, "The posted Product data was not valid")
+    @api.response(409, "The Product was changed by another request")
+    @api.response(412, "The Product does not match the If-Match header")
     @api.expect(product_model)
     @api.marshal_with(product_model)
     def put(self, product_id):
         """
         Update a Product
 
-        This endpoint will update a Product based the body that is posted
+        This endpoint will update a Product based the body that is posted.
+        Send the ETag of the Product in If-Match to only update it if it has
+        not changed since it was read.
         """
         app.logger.info("Request to Update a product with id [%s]", product_id)
         # check_content_type("application/json")
 
         # Attempt to find the Product and abort if not found
-        product = Product.find(product_id)
+        product = Product.find_for_update(product_id)
         if not product:
             abort(
                 status.HTTP_404_NOT_FOUND,
                 f"Product with id '{product_id}' was not found.",
             )
 
+        # The version identifies the stored Product whatever the encoding of
+        # the response, so the weak ETag of a compressed response also matches
+        if request.if_match and not request.if_match.contains_weak(product.etag()):
+            abort(
+                status.HTTP_412_PRECONDITION_FAILED,
+                f"Product with id '{product_id}' has changed since it was read.",
+            )
+
         app.logger.debug("Payload = %s", api.payload)
         data = api.payload
         product.deserialize(data)
         product.id = product_id
         product.update()
         app.logger.info("Product with ID: %d updated.", product.id)
-        return product.serialize(), status.HTTP_200_OK
+        return (
+            product.serialize(),
+            status.HTTP_200_OK,
+            {"ETag": quote_etag(product.etag())},
+        )
 
     # ------------------------------------------------------------------
     # DELETE A PRODUCT
     # ------------------------------------------------------------------
     @api.doc("delete_products")
     @api.response(204, "Product deleted")
+    @api.response(409, "The Product was changed by another request")
     def delete(self, product_id):
         """
         Delete a Product
@@ -201,7 +448,7 @@ class ProductResource(Resource):
         This endpoint will delete a Product based the id specified in the path
         """
         app.logger.info("Request to Delete a product with id [%s]", product_id)
-        product = Product.find(product_id)
+        product = Product.find_for_update(product_id)
         if product:
             app.logger.info("Product with ID: %d found.", product.id)
             product.delete()
@@ -221,31 +468,96 @@ class ProductCollection(Resource):
     # ------------------------------------------------------------------
     @api.doc("list_products")
     @api.expect(product_args, validate=True)
-    @api.marshal_list_with(product_model)
+    @api.response(200, "Success", [product_model])
     def get(self):
         """Returns all of the Products"""
         app.logger.info("Request to list Products...")
-        products = []
         args = product_args.parse_args()
-        if args["description"]:
-            app.logger.info("Filtering by description: %s", args["description"])
-            products = Product.find_by_description(args["description"])
-        elif args["name"]:
-            app.logger.info("Filtering by name: %s", args["name"])
-            products = Product.find_by_name(args["name"])
-        elif args["available"]:
-            app.logger.info("Filtering by availability: %s", args["available"])
-            products = Product.find_by_availability(args["available"])
-        elif args["price"]:
-            app.logger.info("Filtering by price: %s", args["price"])
-            products = Product.find_by_price(Decimal(args["price"]))
-        else:
-            app.logger.info("Returning unfiltered list.")
-            products = Product.all()
+        filters = {key: args[key] for key in SEARCH_FILTERS}
+        app.logger.info(
+            "Filtering by %s",
+            {key: value for key, value in filters.items() if value is not None},
+        )
+        # clients that have just written read the database, like the
+        # replica routing, because the snapshot may not have their writes
+        if (
+            snapshot.enabled
+            and set(request.args) <= {"limit"}
+            and not request.cookies.get(READ_PRIMARY_COOKIE)
+        ):
+            snapshot.refresh(
+                lambda: list(
+                    map(product_document, Product.response_columns(Product.search()))
+                )
+            )
+            return snapshot.response(args["limit"], encode_cursor)
+
+        products = Product.response_columns(Product.search(**filters), args["fields"])
+
+        headers = {}
+        if args["limit"] or args["cursor"]:
+            limit = args["limit"] or app.config["PAGE_SIZE_DEFAULT"]
+            products, has_more = Product.find_page(
+                products, limit, decode_cursor(args["cursor"])
+            )
+            if has_more:
+                headers["X-Next-Cursor"] = encode_cursor(products[-1].id)
+        elif args["stream"]:
+            products = Product.stream(products, app.config["STREAM_BATCH_SIZE"])
+
+        if args["stream"]:
+            return stream_products(products, args["stream"], headers, args["fields"])
 
         # app.logger.info("[%s] Products returned", len(products))
-        results = [product.serialize() for product in products]
-        return results, status.HTTP_200_OK
+        results = [product_document(product, args["fields"]) for product in products]
+        return fast_json.output_json(results, status.HTTP_200_OK, headers)
+
+    # ------------------------------------------------------------------
+    # UPDATE MANY PRODUCTS
+    # ------------------------------------------------------------------
+    @api.doc("update_products_in_bulk")
+    @api.response(400, "The changes or the selection were not valid")
+    @api.expect(bulk_update_model, filter_args)
+    def patch(self):
+        """
+        Updates many Products
+
+        Every Product whose id is in "ids" and that matches the query string
+        filters gets the "changes" applied by a single UPDATE statement.
+        """
+        app.logger.info("Request to Update Products in bulk")
+        data = api.payload
+        if not isinstance(data, dict):
+            raise DataValidationError("Bulk update requires a JSON object")
+        changes = Product.deserialize_changes(data.get("changes"))
+        query = bulk_selection(data.get("ids"), filter_args.parse_args())
+        count = Product.update_many(query, changes)
+        app.logger.info("Updated %d Products", count)
+        return {"updated": count}, status.HTTP_200_OK
+
+    # ------------------------------------------------------------------
+    # DELETE MANY PRODUCTS
+    # ------------------------------------------------------------------
+    @api.doc("delete_products_in_bulk")
+    @api.response(400, "The selection was not valid")
+    @api.expect(bulk_delete_model, filter_args)
+    def delete(self):
+        """
+        Deletes many Products
+
+        Every Product whose id is in "ids" and that matches the query string
+        filters is removed by a single DELETE statement.
+        """
+        app.logger.info("Request to Delete Products in bulk")
+        data = request.get_json(silent=True)
+        if data is None:
+            data = {}  # the query string filters alone select the Products
+        if not isinstance(data, dict):
+            raise DataValidationError("Bulk delete requires a JSON object")
+        query = bulk_selection(data.get("ids"), filter_args.parse_args())
+        count = Product.delete_many(query)
+        app.logger.info("Deleted %d Products", count)
+        return {"deleted": count}, status.HTTP_200_OK
 
     # ------------------------------------------------------------------
     # ADD A NEW PRODUCT
@@ -271,6 +583,148 @@ class ProductCollection(Resource):
         return product.serialize(), status.HTTP_201_CREATED, {"Location": location_url}
 
 
+######################################################################
+#  PATH: /products/search
+######################################################################
+@api.route("/products/search")
+class ProductSearch(Resource):
+    """Handles full-text search of Products"""
+
+    @api.doc("search_products")
+    @api.expect(search_args, validate=True)
+    @api.response(400, "The search terms or the cursor were not valid")
+    @api.response(200, "Success", [product_model])
+    def get(self):
+        """
+        Searches the Products
+
+        This endpoint returns the Products whose name or description match
+        the search terms, best matches first, one page at a time.
+        """
+        args = search_args.parse_args()
+        app.logger.info("Request to search Products for %s", args["q"])
+        limit = args["limit"] or app.config["PAGE_SIZE_DEFAULT"]
+        offset = decode_cursor(args["cursor"], "offset") or 0
+        products, has_more = Product.find_ranked_page(
+            Product.response_columns(Product.search_text(args["q"])), limit, offset
+        )
+
+        headers = {}
+        if has_more:
+            headers["X-Next-Cursor"] = encode_cursor(offset + limit, "offset")
+        results = [product_document(product) for product in products]
+        return fast_json.output_json(results, status.HTTP_200_OK, headers)
+
+
+######################################################################
+#  PATH: /products/autocomplete
+######################################################################
+@api.route("/products/autocomplete")
+class ProductAutocomplete(Resource):
+    """Handles typeahead of Product names"""
+
+    @api.doc("autocomplete_products")
+    @api.expect(autocomplete_args, validate=True)
+    @api.response(400, "The typed text or the limit were not valid")
+    @api.response(200, "Success", [autocomplete_model])
+    def get(self):
+        """
+        Completes a Product name
+
+        This endpoint returns the names starting with the text typed so far,
+        followed by similar names so that typos still find a match.
+        """
+        args = autocomplete_args.parse_args()
+        app.logger.info("Request to autocomplete Product names for %s", args["q"])
+        limit = args["limit"] or app.config["AUTOCOMPLETE_LIMIT"]
+        names = Product.autocomplete(args["q"], limit)
+        results = [{"id": product_id, "name": name} for product_id, name in names]
+        return marshal(results, autocomplete_model), status.HTTP_200_OK
+
+
+######################################################################
+#  PATH: /products/changes
+######################################################################
+@api.route("/products/changes")
+class ProductChanges(Resource):
+    """Handles the feed of changes to the Products"""
+
+    @api.doc("list_product_changes")
+    @api.expect(changes_args, validate=True)
+    @api.response(400, "The token or the limit were not valid")
+    @api.response(501, "The database does not record changes")
+    @api.response(200, "Newline delimited JSON changes")
+    def get(self):
+        """
+        Lists the changes to the Products made after a token
+
+        This endpoint returns the inserts, updates, purchases and deletes
+        of Products as newline delimited JSON, oldest first. Every change
+        has the token to resume from once it is processed, and the
+        X-Next-Token header has the token to ask for the changes that follow.
+        """
+        args = changes_args.parse_args()
+        app.logger.info("Request for Product changes since %s", args["since"])
+        if not ProductChange.recorded(db.session.get_bind().dialect.name):
+            abort(
+                status.HTTP_501_NOT_IMPLEMENTED,
+                "The change feed needs PostgreSQL, which records the changes.",
+            )
+        position = decode_change_token(args["since"])
+        limit = args["limit"] or app.config["CHANGES_LIMIT_DEFAULT"]
+        changes, horizon = ProductChange.after(*position, limit)
+
+        lines = []
+        for change in changes:
+            position = (change.txid, change.id)
+            lines.append(
+                fast_json.encode(
+                    {"token": encode_change_token(*position), **change.serialize()}
+                )
+            )
+        # Every change made before the horizon has been listed
+        if len(changes) < limit:
+            position = max(position, (horizon, 0))
+        return Response(
+            b"".join(line + b"\n" for line in lines),
+            status=status.HTTP_200_OK,
+            headers={"X-Next-Token": encode_change_token(*position)},
+            mimetype="application/x-ndjson",
+        )
+
+
+######################################################################
+#  PATH: /products/bulk
+######################################################################
+@api.route("/products/bulk")
+class ProductBulkCollection(Resource):
+    """Handles bulk operations on collections of Products"""
+
+    # ------------------------------------------------------------------
+    # ADD MANY NEW PRODUCTS
+    # ------------------------------------------------------------------
+    @api.doc("create_products_in_bulk")
+    @api.response(400, "None of the posted Products were valid")
+    @api.expect([create_model])
+    def post(self):
+        """
+        Creates many Products
+
+        This endpoint accepts a JSON array or an NDJSON stream of Products.
+        Every valid Product is inserted in a single transaction and the
+        Products that fail validation are reported by their index.
+        """
+        app.logger.info("Request to Create Products in bulk")
+        errors = []
+        products = deserialize_products(read_bulk_payload(), errors)
+        ids = Product.create_many(products, app.config["BULK_CHUNK_SIZE"])
+        app.logger.info("Created %d Products, rejected %d", len(ids), len(errors))
+        code = status.HTTP_201_CREATED
+        if errors and not ids:
+            code = status.HTTP_400_BAD_REQUEST
+        return {"created": ids, "errors": errors}, code
+
+
 ######################################################################
 #  PATH: /products/{id}/purchase
 ######################################################################
@@ -289,19 +743,18 @@ class PurchaseResource(Resource):
         This endpoint will purchase a Product and make it unavailable
         """
         app.logger.info("Request to Purchase a Product")
-        product = Product.find(product_id)
+        product = Product.purchase(product_id)
         if not product:
-            abort(
-                status.HTTP_404_NOT_FOUND,
-                f"Product with id [{product_id}] was not found.",
-            )
-        if not product.available:
+            # Only a failed purchase needs a read, to explain why it failed
+            if not Product.find(product_id):
+                abort(
+                    status.HTTP_404_NOT_FOUND,
+                    f"Product with id [{product_id}] was not found.",
+                )
             abort(
                 status.HTTP_409_CONFLICT,
                 f"Product with id [{product_id}] is not available.",
             )
-        product.available = False
-        product.update()
         app.logger.info("Product with id [%s] has been purchased!", product.id)
         return product.serialize(), status.HTTP_200_OK
 
@@ -317,6 +770,104 @@ def abort(error_code: int, message: str):
     api.abort(error_code, message)
 
 
+def stream_products(
+    products, output: str, headers: dict, names: list = None
+) -> Response:
+    """Streams Products as a JSON array or as newline delimited JSON
+
+    The rows are written out in batches as they arrive from the database,
+    so memory use does not grow with the size of the listing. Only the
+    fields in names are written when it is given.
+    """
+    batch_size = app.config["STREAM_BATCH_SIZE"]
+
+    def batches():
+        batch = []
+        for product in products:
+            batch.append(fast_json.encode(product_document(product, names)))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def generate_ndjson():
+        for batch in batches():
+            yield b"\n".join(batch) + b"\n"
+
+    def generate_json():
+        prefix = b"["
+        for batch in batches():
+            yield prefix + b",".join(batch)
+            prefix = b","
+        yield b"[]\n" if prefix == b"[" else b"]\n"
+
+    if output == "ndjson":
+        generate, mimetype = generate_ndjson, "application/x-ndjson"
+    else:
+        generate, mimetype = generate_json, "application/json"
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers=headers)
+
+
+def read_bulk_payload():
+    """Returns the items of a JSON array or of an NDJSON request body
+
+    NDJSON bodies are read line by line from the request stream, so large
+    imports are never held in memory as a whole.
+    """
+    if request.mimetype == "application/x-ndjson":
+        return (line for line in request.stream if line.strip())
+    data = request.get_json()
+    if not isinstance(data, list):
+        raise DataValidationError("Bulk create requires a JSON array of Products")
+    return data
+
+
+def deserialize_products(items, errors: list):
+    """Yields a Product for every valid item and records the invalid ones"""
+    for position, item in enumerate(items):
+        try:
+            if isinstance(item, bytes):
+                item = json.loads(item)
+            yield Product().deserialize(item)
+        except (DataValidationError, ValueError, ArithmeticError) as error:
+            errors.append({"index": position, "message": str(error)})
+
+
+def bulk_selection(ids, args: dict):
+    """Returns a query for the Products selected by a bulk update or delete
+
+    Bulk operations must name the Products they affect, either by listing
+    their ids, by filtering on the query string, or both. Any other query
+    string argument, such as a limit, is rejected rather than ignored.
+    """
+    unknown = sorted(set(request.args) - set(SEARCH_FILTERS))
+    if unknown:
+        raise DataValidationError(
+            f"Bulk operations only take filters, not: {', '.join(unknown)}"
+        )
+    filters = {key: args[key] for key in SEARCH_FILTERS}
+    if ids is None and all(value is None for value in filters.values()):
+        raise DataValidationError("Bulk operations require ids or a filter")
+    if ids is not None and not (
+        isinstance(ids, list) and all(is_product_id(product_id) for product_id in ids)
+    ):
+        raise DataValidationError("Invalid ids: must be a list of integers")
+    query = Product.search(**filters)
+    if ids is not None:
+        query = query.filter(Product.id.in_(ids))
+    return query
+
+
+def is_product_id(value) -> bool:
+    """Returns True for an integer a Product id can hold, False for a bool"""
+    return (
+        isinstance(value, int)
+        and not isinstance(value, bool)
+        and 0 <= value <= INTEGER_MAX
+    )
+
+
 def data_reset():
     """Removes all Products from the database"""
     Product.remove_all()
@@ -23,10 +23,13 @@ import os
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
 from click.testing import CliRunner
+from sqlalchemy.pool import StaticPool
 
 # pylint: disable=unused-import
 from wsgi import app  # noqa: F401
-from service.common.cli_commands import db_create, reset_db  # noqa: E402
+from service import config, create_app
+from service.common.cli_commands import db_create, db_init, reset_db  # noqa: E402
+from service.models import db
 
 
 class TestFlaskCLI(TestCase):
@@ -53,3 +56,30 @@ class TestFlaskCLI(TestCase):
             self.assertEqual(result.exit_code, 0)
             db_mock.drop_all.assert_called_once()
             db_mock.create_all.assert_called_once()
+
+    @patch("service.common.cli_commands.migrations")
+    @patch("service.common.cli_commands.db")
+    def test_db_init(self, db_mock, migrations_mock):
+        """It should apply the pending migrations without dropping any table"""
+        with patch.dict(os.environ, {"FLASK_APP": "wsgi:app"}, clear=True):
+            result = self.runner.invoke(db_init)
+            self.assertEqual(result.exit_code, 0)
+            migrations_mock.upgrade.assert_called_once()
+            db_mock.drop_all.assert_not_called()
+
+    @patch("service.models.db.create_all")
+    def test_boot_without_create_all(self, create_all_mock):
+        """It should boot without DDL or Swagger UI when both are turned off"""
+        with patch.multiple(config, DB_AUTO_CREATE=False, API_DOCS=False):
+            new_app = create_app()
+        create_all_mock.assert_not_called()
+        self.assertEqual(new_app.test_client().get("/apidocs").status_code, 404)
+
+    def test_boot_on_sqlite(self):
+        """It should boot on an in-memory SQLite database and its own pool"""
+        with patch.multiple(
+            config, SQLALCHEMY_DATABASE_URI="sqlite://", DB_AUTO_CREATE=False
+        ):
+            new_app = create_app()
+        with new_app.app_context():
+            self.assertIsInstance(db.engine.pool, StaticPool)
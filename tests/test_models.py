@@ -24,12 +24,15 @@ import logging
 from decimal import Decimal
 from unittest import TestCase
 from unittest.mock import patch
+from sqlalchemy import inspect, text
 
 # Third-party imports
 from wsgi import app
 
 # Local application imports
-from service.models import Product, DataValidationError, db
+from service.models import Product, DataValidationError, DataConflictError, db
+from service.common.cache import cache
+from service.common.name_index import name_index
 from .factories import ProductFactory
 
 DATABASE_URI = os.getenv(
@@ -62,6 +65,7 @@ class TestCaseBase(TestCase):
         """This runs before each test"""
         db.session.query(Product).delete()  # clean up the last tests
         db.session.commit()
+        cache.clear()
 
     def tearDown(self):
         """This runs after each test"""
@@ -107,6 +111,31 @@ class TestCaseBase(TestCase):
         self.assertEqual(data.image_url, product.image_url)
         self.assertEqual(data.available, product.available)
 
+    def test_create_many_products(self):
+        """It should create many Products in chunks in one transaction"""
+        products = ProductFactory.create_batch(7)
+        ids = Product.create_many(products, 3)
+        self.assertEqual(len(ids), 7)
+        self.assertEqual(len(Product.all()), 7)
+        for product_id, product in zip(ids, products):
+            self.assertEqual(Product.find(product_id).name, product.name)
+        self.assertEqual(Product.create_many([], 3), [])
+
+    def test_update_and_delete_many_products(self):
+        """It should update and delete many Products with single statements"""
+        for product in ProductFactory.create_batch(6):
+            product.create()
+        changes = Product.deserialize_changes({"price": 12.345, "available": False})
+        self.assertEqual(changes["price"], Decimal("12.35"))
+        self.assertEqual(Product.update_many(Product.query, changes), 6)
+        self.assertEqual(Product.search(price=Decimal("12.35")).count(), 6)
+        query = Product.query.filter(
+            Product.id.in_([product.id for product in Product.all()[:2]])
+        )
+        self.assertEqual(Product.delete_many(query), 2)
+        self.assertEqual(Product.remove_all(), 4)
+        self.assertEqual(Product.all(), [])
+
     def test_delete_product(self):
         """It should delete a Product"""
         # Create a product using a factory or a similar method
@@ -214,6 +243,14 @@ class TestCaseBase(TestCase):
         product = Product()
         self.assertRaises(DataValidationError, product.deserialize, data)
 
+    def test_deserialize_bad_strings(self):
+        """It should not deserialize strings of the wrong type or too long"""
+        for column, value in (("name", "x" * 101), ("image_url", 42)):
+            with self.subTest(column=column):
+                data = ProductFactory().serialize()
+                data[column] = value
+                self.assertRaises(DataValidationError, Product().deserialize, data)
+
     def test_deserialize_bad_data(self):
         """It should not deserialize bad data"""
         data = "this is not a dictionary"  # Invalid data type
@@ -252,6 +289,34 @@ class TestCaseBase(TestCase):
         product.id = None
         self.assertRaises(DataValidationError, product.update)
 
+    def test_update_stale_product(self):
+        """It should not Update a Product that was changed by someone else"""
+        product = ProductFactory()
+        product.create()
+        self.assertEqual(product.version, 1)
+        self.assertEqual(product.etag(), f"{product.id}-1")
+        # another request updates the row behind this session's back
+        with db.engine.begin() as conn:
+            conn.execute(
+                text("UPDATE product SET version = version + 1 WHERE id = :id"),
+                {"id": product.id},
+            )
+        product.name = "new_name"
+        self.assertRaises(DataConflictError, product.update)
+        self.assertEqual(Product.find(product.id).version, 2)
+
+    def test_purchase_a_product(self):
+        """It should Purchase an available Product only once"""
+        product = ProductFactory(available=True)
+        product.create()
+        purchased = Product.purchase(product.id)
+        self.assertEqual(purchased.id, product.id)
+        self.assertFalse(purchased.available)
+        self.assertEqual(purchased.version, 2)
+        self.assertIsNone(Product.purchase(product.id))
+        self.assertIsNone(Product.purchase(0))
+        self.assertIsNone(Product.purchase("abc"))
+
 
 ######################################################################
 #  T E S T   E X C E P T I O N   H A N D L E R S
@@ -266,6 +331,34 @@ class TestExceptionHandlers(TestCase):
         product = ProductFactory()
         self.assertRaises(DataValidationError, product.create)
 
+    @patch("service.models.db.session.commit")
+    def test_purchase_exception(self, exception_mock):
+        """It should catch a purchase exception"""
+        exception_mock.side_effect = Exception()
+        self.assertRaises(DataValidationError, Product.purchase, 1)
+
+    @patch("service.models.db.session.commit")
+    def test_create_many_exception(self, exception_mock):
+        """It should catch a bulk create exception"""
+        exception_mock.side_effect = Exception()
+        self.assertRaises(DataValidationError, Product.create_many, [], 10)
+
+    @patch("service.models.db.session.commit")
+    def test_update_many_exception(self, exception_mock):
+        """It should catch a bulk update exception"""
+        exception_mock.side_effect = Exception()
+        query = Product.query.filter(Product.id < 0)
+        self.assertRaises(
+            DataValidationError, Product.update_many, query, {"name": "x"}
+        )
+
+    @patch("service.models.db.session.commit")
+    def test_delete_many_exception(self, exception_mock):
+        """It should catch a bulk delete exception"""
+        exception_mock.side_effect = Exception()
+        query = Product.query.filter(Product.id < 0)
+        self.assertRaises(DataValidationError, Product.delete_many, query)
+
     @patch("service.models.db.session.commit")
     def test_update_exception(self, exception_mock):
         """It should catch a update exception"""
@@ -316,6 +409,154 @@ class TestModelQueries(TestCaseBase):
         for product in found:
             self.assertEqual(product.name, name)
 
+    def test_search_combines_filters(self):
+        """It should Search Products matching every filter"""
+        products = ProductFactory.create_batch(10)
+        for product in products:
+            product.create()
+        price_min, price_max = Decimal("20"), Decimal("40")
+        expected = {
+            product.id
+            for product in products
+            if product.available and price_min <= product.price <= price_max
+        }
+        found = Product.search(available=True, price_min=price_min, price_max=price_max)
+        self.assertEqual({product.id for product in found}, expected)
+        found = Product.search(name=products[0].name, price=None)
+        self.assertIn(products[0].id, [product.id for product in found])
+
+    def test_search_bad_filters(self):
+        """It should not Search with unknown or badly typed filters"""
+        self.assertRaises(DataValidationError, Product.search, color="red")
+        self.assertRaises(TypeError, Product.search, available="yes")
+
+    def test_filter_columns_are_indexed(self):
+        """It should index every column Products can be filtered on"""
+        indexes = {
+            index["name"]: index["column_names"]
+            for index in inspect(db.engine).get_indexes(Product.__tablename__)
+        }
+        for column in ("name", "description", "price", "image_url"):
+            self.assertEqual(indexes[f"ix_product_{column}"], [column])
+        self.assertEqual(indexes["ix_product_available_price"], ["available", "price"])
+        self.assertEqual(indexes["ix_product_available_id"], ["id"])
+
+    def test_find_page(self):
+        """It should Find Products one keyset page at a time"""
+        products = ProductFactory.create_batch(5)
+        for product in products:
+            product.create()
+        ids = sorted(product.id for product in products)
+        page, has_more = Product.find_page(Product.query, 3)
+        self.assertEqual([product.id for product in page], ids[:3])
+        self.assertTrue(has_more)
+        page, has_more = Product.find_page(Product.query, 3, page[-1].id)
+        self.assertEqual([product.id for product in page], ids[3:])
+        self.assertFalse(has_more)
+
+    def test_search_text(self):
+        """It should Search Products by text, best matches first"""
+        names = [
+            ("Red mug", "A mug for coffee"),
+            ("Coffee mug", "A large red mug for coffee and tea"),
+            ("Blue plate", "A plate"),
+        ]
+        for name, description in names:
+            ProductFactory(name=name, description=description).create()
+        found = Product.search_text("red mug").all()
+        self.assertEqual([product.name for product in found], ["Red mug", "Coffee mug"])
+        found = Product.search_text("coffee -tea").all()
+        self.assertEqual([product.name for product in found], ["Red mug"])
+        self.assertEqual(Product.search_text("teapot").count(), 0)
+
+    def test_search_text_fallback(self):
+        """It should Search Products by substring without full-text search"""
+        for name, description in [
+            ("Red mug", "A mug for coffee"),
+            ("Coffee mug", "A large red mug"),
+            ("Blue plate", "100% porcelain"),
+        ]:
+            ProductFactory(name=name, description=description).create()
+        found = Product.search_text("mug RED", dialect="sqlite").all()
+        self.assertEqual([product.name for product in found], ["Red mug", "Coffee mug"])
+        found = Product.search_text("100%", dialect="sqlite").all()
+        self.assertEqual([product.name for product in found], ["Blue plate"])
+        self.assertEqual(Product.search_text("0%p", dialect="sqlite").count(), 0)
+        self.assertEqual(Product.search_text("  ", dialect="sqlite").count(), 0)
+
+    def test_find_ranked_page(self):
+        """It should Find ranked Products one page at a time"""
+        for number in range(5):
+            ProductFactory(name=f"mug {number}").create()
+        query = Product.search_text("mug")
+        page, has_more = Product.find_ranked_page(query, 3)
+        self.assertEqual(len(page), 3)
+        self.assertTrue(has_more)
+        rest, has_more = Product.find_ranked_page(query, 3, 3)
+        self.assertEqual(len(rest), 2)
+        self.assertFalse(has_more)
+        self.assertFalse({p.id for p in page} & {p.id for p in rest})
+
+    def test_autocomplete(self):
+        """It should complete Product names by prefix"""
+        for name in [
+            "Coffee mug",
+            "coffee maker",
+            "Red mug",
+            "100% cotton",
+            "1000 pins",
+        ]:
+            ProductFactory(name=name).create()
+        found = Product.autocomplete("COFFEE", 10)
+        self.assertEqual([name for _, name in found], ["coffee maker", "Coffee mug"])
+        self.assertEqual(len(Product.autocomplete("coffee", 1)), 1)
+        self.assertEqual(
+            [name for _, name in Product.autocomplete("100%", 10)], ["100% cotton"]
+        )
+        self.assertEqual(Product.autocomplete("_", 10), [])
+
+    def test_autocomplete_from_index(self):
+        """It should complete Product names from the in-process index"""
+        for name in ["Coffee mug", "Coffee maker", "Red mug"]:
+            ProductFactory(name=name).create()
+        with patch.object(name_index, "enabled", True):
+            name_index.invalidate()
+            found = Product.autocomplete("cofee", 10)
+            self.assertEqual(
+                [name for _, name in found], ["Coffee maker", "Coffee mug"]
+            )
+            # writes update the index without reloading it
+            product = ProductFactory(name="Copper kettle")
+            product.create()
+            self.assertEqual(
+                Product.autocomplete("copper", 10), [(product.id, "Copper kettle")]
+            )
+            product.name = "Teapot"
+            product.update()
+            self.assertEqual(Product.autocomplete("teap", 10), [(product.id, "Teapot")])
+            product.delete()
+            self.assertEqual(Product.autocomplete("teap", 10), [])
+            ids = Product.create_many([ProductFactory(name="Kettle")], 10)
+            self.assertEqual(Product.autocomplete("kett", 10), [(ids[0], "Kettle")])
+            Product.update_many(Product.query, {"name": "Mug"})
+            self.assertTrue(name_index.is_stale())
+            self.assertEqual(len(Product.autocomplete("mug", 10)), 4)
+            Product.remove_all()
+            self.assertEqual(Product.autocomplete("mug", 10), [])
+        name_index.invalidate()
+
+    def test_response_columns(self):
+        """It should only select the requested columns and the id"""
+        product = ProductFactory()
+        product.create()
+        query = Product.response_columns(Product.query, ["name", "price"])
+        self.assertNotIn("description", str(query.statement))
+        row = query.one()
+        self.assertEqual(row._fields, ("id", "name", "price"))
+        self.assertEqual((row.id, row.name), (product.id, product.name))
+        row = Product.response_columns(Product.query).one()
+        self.assertEqual(len(row), 6)
+
     def test_find_by_availability(self):
         """It should Find Products by availability"""
         products = ProductFactory.create_batch(10)
@@ -0,0 +1,99 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Test cases for the Product Name Index
+"""
+
+from unittest import TestCase
+from unittest.mock import patch
+from service.common.name_index import NameIndex, trigrams
+
+NAMES = [(1, "Coffee mug"), (2, "Coffee maker"), (3, "Red mug"), (4, "Cold brew")]
+
+
+######################################################################
+#  N A M E   I N D E X   T E S T   C A S E S
+######################################################################
+class TestNameIndex(TestCase):
+    """Name Index Tests"""
+
+    def setUp(self):
+        """Runs before each test"""
+        self.index = NameIndex()
+        self.index.enabled = True
+        self.index.load(NAMES)
+
+    def test_trigrams(self):
+        """It should split every word into padded trigrams"""
+        self.assertEqual(trigrams("Mug"), {"  m", " mu", "mug", "ug "})
+        self.assertEqual(
+            trigrams("red Mu", complete=False), trigrams("red") | {"  m", " mu"}
+        )
+        self.assertEqual(trigrams("  "), set())
+
+    def test_complete_prefix(self):
+        """It should complete names by prefix in alphabetical order"""
+        self.assertEqual(
+            self.index.complete("coffee m", 10),
+            [(2, "Coffee maker"), (1, "Coffee mug")],
+        )
+        self.assertEqual(
+            self.index.complete("CO", 2), [(2, "Coffee maker"), (1, "Coffee mug")]
+        )
+
+    def test_complete_typo(self):
+        """It should complete names with typos after the prefix matches"""
+        self.assertEqual(self.index.complete("cofee", 10)[0][1], "Coffee maker")
+        self.assertEqual(
+            {name for _, name in self.index.complete("cofee", 10)},
+            {"Coffee maker", "Coffee mug"},
+        )
+        found = self.index.complete("red", 10)
+        self.assertEqual(found[0], (3, "Red mug"))
+        self.assertEqual(self.index.complete("xyz", 10), [])
+        self.assertEqual(self.index.complete("!", 10), [])
+
+    def test_add_and_remove(self):
+        """It should update the index in place after writes"""
+        self.index.add(5, "Kettle")
+        self.assertEqual(self.index.complete("ket", 10), [(5, "Kettle")])
+        self.index.add(5, "Teapot")
+        self.assertEqual(self.index.complete("ket", 10), [])
+        self.assertEqual(self.index.complete("tea", 10), [(5, "Teapot")])
+        self.index.remove(5)
+        self.index.remove(42)
+        self.assertEqual(self.index.complete("tea", 10), [])
+
+    def test_stale_index(self):
+        """It should ignore writes until the index is reloaded"""
+        self.assertFalse(self.index.is_stale())
+        self.index.invalidate()
+        self.assertTrue(self.index.is_stale())
+        self.index.add(5, "Kettle")
+        self.index.load(NAMES)
+        self.assertEqual(self.index.complete("ket", 10), [])
+        with patch("service.common.name_index.time.monotonic", return_value=1e12):
+            self.assertTrue(self.index.is_stale())
+
+    def test_disabled_index(self):
+        """It should ignore writes while disabled"""
+        self.index.enabled = False
+        self.index.add(5, "Kettle")
+        self.index.remove(1)
+        self.index.enabled = True
+        self.assertEqual(self.index.complete("ket", 10), [])
+        self.assertEqual(len(self.index.complete("coffee", 10)), 2)
@@ -0,0 +1,104 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Test cases for the Connection Pool
+"""
+
+from unittest import TestCase
+from sqlalchemy import create_engine, exc
+from sqlalchemy.pool import QueuePool
+from service.common.pool import TimedQueuePool, engine_options, pool_stats
+
+OPTIONS = {"pool_size": 2, "max_overflow": 1, "pool_timeout": 5, "pool_recycle": 60}
+
+
+######################################################################
+#  P O O L   T E S T   C A S E S
+######################################################################
+class TestTimedQueuePool(TestCase):
+    """Timed Connection Pool Tests"""
+
+    def setUp(self):
+        """Runs before each test"""
+        self.engine = create_engine(
+            "sqlite://",
+            poolclass=TimedQueuePool,
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=0.05,
+        )
+        self.pool = self.engine.pool
+
+    def tearDown(self):
+        """Runs after each test"""
+        self.engine.dispose()
+
+    def test_stats_before_use(self):
+        """It should report an idle pool"""
+        stats = self.pool.stats()
+        self.assertEqual(stats["size"], 1)
+        self.assertEqual(stats["checked_out"], 0)
+        self.assertEqual(stats["checkouts"], 0)
+        self.assertEqual(stats["wait_ms_avg"], 0.0)
+
+    def test_counts_checkouts(self):
+        """It should count each checkout once and report checked out connections"""
+        with self.engine.connect():
+            stats = self.pool.stats()
+            self.assertEqual(stats["checked_out"], 1)
+            self.assertEqual(stats["checkouts"], 1)
+        with self.engine.connect():
+            pass
+        stats = self.pool.stats()
+        self.assertEqual(stats["checked_out"], 0)
+        self.assertEqual(stats["checked_in"], 1)
+        self.assertEqual(stats["checkouts"], 2)
+        self.assertGreaterEqual(stats["wait_ms_max"], stats["wait_ms_avg"])
+
+    def test_counts_timeouts(self):
+        """It should count checkouts that time out waiting for a connection"""
+        with self.engine.connect():
+            self.assertRaises(exc.TimeoutError, self.engine.connect)
+        stats = self.pool.stats()
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(stats["checkouts"], 2)
+        self.assertGreaterEqual(stats["wait_ms_max"], 50)
+
+
+######################################################################
+#  E N G I N E   O P T I O N S   T E S T   C A S E S
+######################################################################
+class TestEngineOptions(TestCase):
+    """Engine Options Tests"""
+
+    def test_queue_pool_options(self):
+        """It should time the QueuePool of synchronous PostgreSQL engines"""
+        options = engine_options("postgresql+psycopg://localhost/db", OPTIONS)
+        self.assertEqual(options, {"poolclass": TimedQueuePool, **OPTIONS})
+        options = engine_options(
+            "postgresql+psycopg://localhost/db", OPTIONS, asynchronous=True
+        )
+        self.assertEqual(options, OPTIONS)
+
+    def test_other_pools(self):
+        """It should keep the pool of in-memory SQLite and only its options"""
+        options = engine_options("sqlite://", OPTIONS)
+        self.assertEqual(options, {"pool_recycle": 60})
+        engine = create_engine("sqlite://", **options)
+        self.assertNotIsInstance(engine.pool, QueuePool)
+        self.assertEqual(pool_stats(engine.pool), {"status": engine.pool.status()})
+        engine.dispose()
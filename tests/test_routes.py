@@ -20,15 +20,19 @@ TestProduct API Service Test Suite
 
 # pylint: disable=duplicate-code
 import os
+import json
 import logging
 from unittest import TestCase
+from unittest.mock import patch
 from urllib.parse import quote_plus
 from decimal import Decimal
-
-# from unittest.mock import patch
+from sqlalchemy import text
+from sqlalchemy.orm.exc import StaleDataError
 from tests.factories import ProductFactory
 from wsgi import app
 from service.common import status
+from service import routes
+from service.common.cache import cache
 
 # from service.models import DataValidationError
 from service.models import db, Product
@@ -43,7 +47,7 @@ BASE_URL = "/api/products"
 ######################################################################
 #  T E S T   C A S E S
 ######################################################################
-# pylint: disable=too-many-public-methods
+# pylint: disable=too-many-public-methods,too-many-lines
 class TestProductService(TestCase):
     """REST API Server Tests"""
 
@@ -67,6 +71,7 @@ class TestProductService(TestCase):
         self.client = app.test_client()
         db.session.query(Product).delete()  # clean up the last tests
         db.session.commit()
+        cache.clear()
 
     def tearDown(self):
         """This runs after each test"""
@@ -109,6 +114,20 @@ class TestProductService(TestCase):
         self.assertEqual(data["status"], 200)
         self.assertEqual(data["message"], "Healthy")
 
+    def test_worker_stats(self):
+        """It should report the cache and pool counters of the worker"""
+        product = self._create_products(1)[0]
+        self.client.get(f"{BASE_URL}/{product.id}")
+        self.client.get(f"{BASE_URL}/{product.id}")
+        response = self.client.get("/stats")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data["pid"], os.getpid())
+        self.assertEqual(data["cache"]["backend"], "local")
+        self.assertGreaterEqual(data["cache"]["hits"], 1)
+        self.assertGreaterEqual(data["pool"]["checkouts"], 1)
+        self.assertIn("wait_ms_avg", data["pool"])
+
     # ----------------------------------------------------------
     # TEST LIST
     # ----------------------------------------------------------
@@ -208,6 +227,131 @@ class TestProductService(TestCase):
         for product in data:
             self.assertEqual(product["available"], True)
 
+    def test_query_by_unavailability(self):
+        """It should Query Products that are not available"""
+        products = self._create_products(10)
+        unavailable_count = len(
+            [product for product in products if not product.available]
+        )
+        response = self.client.get(BASE_URL, query_string="available=false")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(len(data), unavailable_count)
+        for product in data:
+            self.assertEqual(product["available"], False)
+
+    def test_query_by_combined_filters(self):
+        """It should Query Products matching availability and a price range"""
+        products = self._create_products(10)
+        expected = {
+            product.id
+            for product in products
+            if product.available and 20 <= round(Decimal(product.price), 2) <= 40
+        }
+        response = self.client.get(
+            BASE_URL,
+            query_string={"available": "true", "price_min": "20", "price_max": "40"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual({product["id"] for product in data}, expected)
+        for product in data:
+            self.assertEqual(product["available"], True)
+            self.assertGreaterEqual(Decimal(str(product["price"])), 20)
+            self.assertLessEqual(Decimal(str(product["price"])), 40)
+
+    # ----------------------------------------------------------
+    # TEST PAGINATION
+    # ----------------------------------------------------------
+    def test_list_products_by_page(self):
+        """It should List Products one keyset page at a time"""
+        products = self._create_products(5)
+        ids = []
+        cursor = None
+        for expected in (2, 2, 1):
+            query_string = {"limit": 2}
+            if cursor:
+                query_string["cursor"] = cursor
+            response = self.client.get(BASE_URL, query_string=query_string)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = response.get_json()
+            self.assertEqual(len(data), expected)
+            ids.extend(product["id"] for product in data)
+            cursor = response.headers.get("X-Next-Cursor")
+        self.assertIsNone(cursor)
+        self.assertEqual(ids, sorted(product.id for product in products))
+
+    def test_list_filtered_products_by_page(self):
+        """It should apply the filter to every page"""
+        products = self._create_products(10)
+        available_count = len([product for product in products if product.available])
+        response = self.client.get(
+            BASE_URL, query_string={"available": "true", "limit": 10}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(len(data), available_count)
+        self.assertNotIn("X-Next-Cursor", response.headers)
+
+    def test_list_page_with_default_limit(self):
+        """It should use the default page size when only a cursor is given"""
+        products = self._create_products(3)
+        first_id = min(product.id for product in products)
+        cursor = routes.encode_cursor(first_id)
+        response = self.client.get(BASE_URL, query_string={"cursor": cursor})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(len(data), 2)
+        for product in data:
+            self.assertGreater(product["id"], first_id)
+
+    # ----------------------------------------------------------
+    # TEST STREAMING
+    # ----------------------------------------------------------
+    def test_stream_product_list_as_json(self):
+        """It should Stream the list of Products as a JSON array"""
+        products = self._create_products(5)
+        app.config["STREAM_BATCH_SIZE"] = 2
+        try:
+            response = self.client.get(BASE_URL, query_string="stream=json")
+        finally:
+            app.config["STREAM_BATCH_SIZE"] = 500
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, "application/json")
+        data = response.get_json()
+        self.assertEqual(len(data), 5)
+        self.assertEqual(
+            {product["id"] for product in data}, {product.id for product in products}
+        )
+        listing = self.client.get(BASE_URL).get_json()
+        self.assertEqual(
+            sorted(data, key=lambda p: p["id"]), sorted(listing, key=lambda p: p["id"])
+        )
+
+    def test_stream_empty_product_list(self):
+        """It should Stream an empty JSON array when there are no Products"""
+        response = self.client.get(BASE_URL, query_string="stream=json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), [])
+        response = self.client.get(BASE_URL, query_string="stream=ndjson")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, b"")
+
+    def test_stream_product_list_as_ndjson(self):
+        """It should Stream a filtered page of Products as NDJSON"""
+        self._create_products(5)
+        response = self.client.get(
+            BASE_URL, query_string={"stream": "ndjson", "limit": 3}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        self.assertIn("X-Next-Cursor", response.headers)
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), 3)
+        for line in lines:
+            self.assertIn("name", json.loads(line))
+
     # ----------------------------------------------------------
     # TEST READ FOR PRODUCT
     # ----------------------------------------------------------
@@ -228,6 +372,178 @@ class TestProductService(TestCase):
         logging.debug("Response data = %s", data)
         self.assertIn("was not found", data["message"])
 
+    # ----------------------------------------------------------
+    # TEST SPARSE FIELDSETS
+    # ----------------------------------------------------------
+    def test_list_products_with_fields(self):
+        """It should List only the requested fields of Products"""
+        products = self._create_products(3)
+        response = self.client.get(BASE_URL, query_string="fields=price, name,id")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(len(data), 3)
+        self.assertEqual(list(data[0]), ["id", "name", "price"])
+        prices = {product.id: float(product.price) for product in products}
+        for product in data:
+            self.assertAlmostEqual(product["price"], prices[product["id"]], places=2)
+
+    def test_list_page_with_fields(self):
+        """It should List pages of Products without returning their id"""
+        self._create_products(3)
+        seen = []
+        query = {"fields": "name", "limit": 2}
+        while True:
+            response = self.client.get(BASE_URL, query_string=query)
+            data = response.get_json()
+            self.assertTrue(all(list(product) == ["name"] for product in data))
+            seen.extend(data)
+            if "X-Next-Cursor" not in response.headers:
+                break
+            query["cursor"] = response.headers["X-Next-Cursor"]
+        self.assertEqual(len(seen), 3)
+
+    def test_stream_products_with_fields(self):
+        """It should Stream only the requested fields of Products"""
+        self._create_products(3)
+        response = self.client.get(
+            BASE_URL, query_string="stream=ndjson&fields=available,image_url"
+        )
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(list(json.loads(lines[0])), ["available", "image_url"])
+
+    def test_list_products_with_bad_fields(self):
+        """It should not List Products with unknown fields"""
+        response = self.client.get(BASE_URL, query_string="fields=id,secret")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("secret", response.get_json()["errors"]["fields"])
+        response = self.client.get(BASE_URL, query_string="fields=,")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # ----------------------------------------------------------
+    # TEST SEARCH
+    # ----------------------------------------------------------
+    def test_search_products(self):
+        """It should Search Products by name and description"""
+        for name, description in [
+            ("Red mug", "A mug for coffee"),
+            ("Coffee mug", "A large red mug"),
+            ("Blue plate", "A plate"),
+        ]:
+            ProductFactory(name=name, description=description).create()
+        response = self.client.get(f"{BASE_URL}/search", query_string="q=red mug")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(
+            [product["name"] for product in data], ["Red mug", "Coffee mug"]
+        )
+        self.assertNotIn("X-Next-Cursor", response.headers)
+
+    def test_search_products_by_page(self):
+        """It should Search Products one ranked page at a time"""
+        for number in range(5):
+            ProductFactory(name=f"mug {number}", description="mug").create()
+        seen = []
+        query = {"q": "mug", "limit": 2}
+        while True:
+            response = self.client.get(f"{BASE_URL}/search", query_string=query)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(product["id"] for product in response.get_json())
+            if "X-Next-Cursor" not in response.headers:
+                break
+            query["cursor"] = response.headers["X-Next-Cursor"]
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_search_products_bad_request(self):
+        """It should not Search Products without terms or with a bad cursor"""
+        response = self.client.get(f"{BASE_URL}/search")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{BASE_URL}/search", query_string="q=%20")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        for cursor in (
+            routes.encode_cursor(2),
+            routes.encode_cursor(-2, "offset"),
+            routes.encode_cursor(2**63, "offset"),
+        ):
+            response = self.client.get(
+                f"{BASE_URL}/search", query_string={"q": "mug", "cursor": cursor}
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # ----------------------------------------------------------
+    # TEST AUTOCOMPLETE
+    # ----------------------------------------------------------
+    def test_autocomplete_products(self):
+        """It should Autocomplete Product names"""
+        for name in ["Coffee mug", "Coffee maker", "Red mug"]:
+            ProductFactory(name=name).create()
+        response = self.client.get(f"{BASE_URL}/autocomplete", query_string="q=cof")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(
+            [item["name"] for item in data], ["Coffee maker", "Coffee mug"]
+        )
+        self.assertEqual(set(data[0]), {"id", "name"})
+        response = self.client.get(
+            f"{BASE_URL}/autocomplete", query_string="q=cof&limit=1"
+        )
+        self.assertEqual(len(response.get_json()), 1)
+
+    def test_autocomplete_bad_request(self):
+        """It should not Autocomplete without text or with a bad limit"""
+        response = self.client.get(f"{BASE_URL}/autocomplete")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(
+            f"{BASE_URL}/autocomplete", query_string="q=cof&limit=1000"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # ----------------------------------------------------------
+    # TEST CONDITIONAL GET
+    # ----------------------------------------------------------
+    def test_get_product_not_modified(self):
+        """It should answer 304 when the Product has not changed"""
+        test_product = self._create_products(1)[0]
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        etag = response.headers.get("ETag")
+        self.assertIsNotNone(etag)
+        self.assertFalse(etag.startswith("W/"))
+        response = self.client.get(
+            f"{BASE_URL}/{test_product.id}", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.data, b"")
+        self.assertEqual(response.headers["ETag"], etag)
+
+    def test_get_product_modified(self):
+        """It should answer 200 with a new ETag once the Product changed"""
+        test_product = self._create_products(1)[0]
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        etag = response.headers["ETag"]
+        data = response.get_json()
+        data["name"] = "new_name"
+        self.client.put(f"{BASE_URL}/{test_product.id}", json=data)
+        response = self.client.get(
+            f"{BASE_URL}/{test_product.id}", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(response.get_json()["name"], "new_name")
+
+    def test_list_products_not_modified(self):
+        """It should answer 304 when the listing has not changed"""
+        self._create_products(3)
+        response = self.client.get(BASE_URL)
+        etag = response.headers["ETag"]
+        response = self.client.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self._create_products(1)
+        response = self.client.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(BASE_URL, query_string="stream=json")
+        self.assertNotIn("ETag", response.headers)
+
     # ----------------------------------------------------------
     # TEST CREATE
     # ----------------------------------------------------------
@@ -265,6 +581,58 @@ class TestProductService(TestCase):
         self.assertEqual(new_product["image_url"], test_product.image_url)
         self.assertEqual(new_product["available"], test_product.available)
 
+    def test_create_products_in_bulk(self):
+        """It should Create many Products and report the invalid ones"""
+        payload = [product.serialize() for product in ProductFactory.create_batch(5)]
+        payload.insert(2, {"name": "missing fields"})
+        payload.append({**payload[0], "name": "x" * 200})
+        response = self.client.post(f"{BASE_URL}/bulk", json=payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.get_json()
+        self.assertEqual(len(data["created"]), 5)
+        self.assertEqual([error["index"] for error in data["errors"]], [2, 6])
+        self.assertIn("missing", data["errors"][0]["message"])
+        self.assertIn("longer than 100", data["errors"][1]["message"])
+        for product_id, expected in zip(data["created"], payload[:2] + payload[3:]):
+            found = self.client.get(f"{BASE_URL}/{product_id}").get_json()
+            self.assertEqual(found["name"], expected["name"])
+            self.assertEqual(found["available"], expected["available"])
+
+    def test_create_products_in_bulk_from_ndjson(self):
+        """It should Create many Products from an NDJSON stream"""
+        lines = [
+            json.dumps(product.serialize())
+            for product in ProductFactory.create_batch(3)
+        ]
+        lines.insert(1, "{not json")
+        lines.append("")
+        response = self.client.post(
+            f"{BASE_URL}/bulk",
+            data="\n".join(lines),
+            content_type="application/x-ndjson",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.get_json()
+        self.assertEqual(len(data["created"]), 3)
+        self.assertEqual([error["index"] for error in data["errors"]], [1])
+        self.assertEqual(len(self.client.get(BASE_URL).get_json()), 3)
+
+    def test_create_products_in_bulk_all_invalid(self):
+        """It should not Create Products in bulk when none of them are valid"""
+        payload = [{"name": "no price"}, "not a product", {"price": "abc"}]
+        response = self.client.post(f"{BASE_URL}/bulk", json=payload)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        data = response.get_json()
+        self.assertEqual(data["created"], [])
+        self.assertEqual([error["index"] for error in data["errors"]], [0, 1, 2])
+
+    def test_create_products_in_bulk_not_a_list(self):
+        """It should not Create Products in bulk from a single object"""
+        response = self.client.post(
+            f"{BASE_URL}/bulk", json=ProductFactory().serialize()
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     # ----------------------------------------------------------
     # TEST UPDATE
     # ----------------------------------------------------------
@@ -302,9 +670,221 @@ class TestProductService(TestCase):
         response = self.client.put(f"{BASE_URL}/{product_id}", json=product)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_update_product_if_match(self):
+        """It should only Update a Product whose ETag matches If-Match"""
+        test_product = self._create_products(1)[0]
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        etag = response.headers["ETag"]
+        self.assertEqual(etag, f'"{test_product.id}-1"')
+        product = response.get_json()
+        product["name"] = "new_name"
+
+        response = self.client.put(
+            f"{BASE_URL}/{test_product.id}", json=product, headers={"If-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.headers["ETag"], f'"{test_product.id}-2"')
+
+        # the old ETag is stale now
+        response = self.client.put(
+            f"{BASE_URL}/{test_product.id}", json=product, headers={"If-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+        response = self.client.put(
+            f"{BASE_URL}/{test_product.id}", json=product, headers={"If-Match": "*"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_update_product_conflict(self):
+        """It should answer 409 when a Product changes during an Update"""
+        test_product = self._create_products(1)[0]
+        product = test_product.serialize()
+        with patch(
+            "service.models.db.session.commit",
+            side_effect=StaleDataError("stale"),
+        ):
+            response = self.client.put(f"{BASE_URL}/{test_product.id}", json=product)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertIn("changed by another request", response.get_json()["message"])
+
+    def test_write_after_another_worker(self):
+        """It should Update and Delete a Product another worker changed since it was cached"""
+        test_product = self._create_products(1)[0]
+        url = f"{BASE_URL}/{test_product.id}"
+        product = self.client.get(url).get_json()  # cached now
+        changed_elsewhere = text(
+            "UPDATE product SET version = version + 1 WHERE id = :id"
+        )
+        with db.engine.begin() as connection:
+            connection.execute(changed_elsewhere, {"id": test_product.id})
+        response = self.client.put(url, json=product)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.headers["ETag"], f'"{test_product.id}-3"')
+
+        with db.engine.begin() as connection:
+            connection.execute(changed_elsewhere, {"id": test_product.id})
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_delete_product_conflict(self):
+        """It should answer 409 only when a deleted Product still exists"""
+        test_product = self._create_products(1)[0]
+        url = f"{BASE_URL}/{test_product.id}"
+        with patch(
+            "service.models.db.session.commit", side_effect=StaleDataError("stale")
+        ):
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        # a Product deleted by another request meanwhile is simply gone
+        product = Product.find_for_update(test_product.id)
+        with db.engine.begin() as connection:
+            connection.execute(
+                text("DELETE FROM product WHERE id = :id"), {"id": test_product.id}
+            )
+        with patch.object(Product, "find_for_update", return_value=product):
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_update_products_in_bulk_changes_etag(self):
+        """It should change the ETag of every Product updated in bulk"""
+        test_product = self._create_products(1)[0]
+        url = f"{BASE_URL}/{test_product.id}"
+        response = self.client.get(url)
+        etag = response.headers["ETag"]
+        product = response.get_json()
+        response = self.client.patch(
+            BASE_URL, json={"ids": [test_product.id], "changes": {"price": "9.99"}}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        response = self.client.put(url, json=product, headers={"If-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+    def test_update_products_in_bulk_by_id(self):
+        """It should Update many Products selected by id"""
+        products = self._create_products(5)
+        ids = [product.id for product in products[:3]]
+        response = self.client.patch(
+            BASE_URL, json={"ids": ids, "changes": {"price": "9.99", "available": True}}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), {"updated": 3})
+        for product in self.client.get(BASE_URL).get_json():
+            if product["id"] in ids:
+                self.assertEqual(product["price"], 9.99)
+                self.assertEqual(product["available"], True)
+            else:
+                self.assertNotEqual(product["price"], 9.99)
+
+    def test_update_products_in_bulk_by_filter(self):
+        """It should Update many Products selected by a query string filter"""
+        products = self._create_products(10)
+        unavailable_count = len(
+            [product for product in products if not product.available]
+        )
+        response = self.client.patch(
+            BASE_URL,
+            query_string="available=false",
+            json={"changes": {"description": "sold out"}},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), {"updated": unavailable_count})
+        response = self.client.get(BASE_URL, query_string="description=sold out")
+        self.assertEqual(len(response.get_json()), unavailable_count)
+
+    def test_update_products_in_bulk_bad_changes(self):
+        """It should not Update many Products with invalid changes"""
+        products = self._create_products(1)
+        ids = [products[0].id]
+        for changes in (
+            None,
+            {},
+            {"color": "red"},
+            {"price": "cheap"},
+            {"available": "yes"},
+            {"name": 42},
+            {"description": "x" * 256},
+        ):
+            response = self.client.patch(
+                BASE_URL, json={"ids": ids, "changes": changes}
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(BASE_URL, json=["not", "an", "object"])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_update_products_in_bulk_needs_selection(self):
+        """It should not Update every Product without ids or a filter"""
+        self._create_products(2)
+        response = self.client.patch(BASE_URL, json={"changes": {"price": "1.00"}})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(
+            BASE_URL, json={"ids": ["a"], "changes": {"price": "1.00"}}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     # ----------------------------------------------------------
     # TEST DELETE
     # ----------------------------------------------------------
+    def test_delete_products_in_bulk(self):
+        """It should Delete many Products selected by id and filter"""
+        products = self._create_products(10)
+        ids = [product.id for product in products]
+        available_count = len([product for product in products if product.available])
+        response = self.client.delete(
+            BASE_URL, query_string="available=true", json={"ids": ids}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), {"deleted": available_count})
+        data = self.client.get(BASE_URL).get_json()
+        self.assertEqual(len(data), 10 - available_count)
+        for product in data:
+            self.assertEqual(product["available"], False)
+
+    def test_delete_products_in_bulk_needs_selection(self):
+        """It should not Delete every Product without ids or a filter"""
+        self._create_products(2)
+        response = self.client.delete(BASE_URL)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(self.client.get(BASE_URL).get_json()), 2)
+
+    def test_delete_products_in_bulk_bad_selection(self):
+        """It should not Delete many Products with a bad body or bad ids"""
+        products = self._create_products(1)
+        for body in (
+            [products[0].id],
+            {"ids": [True]},
+            {"ids": [2**31]},
+            {"ids": "all"},
+        ):
+            with self.subTest(body=body):
+                response = self.client.delete(BASE_URL, json=body)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertNotIn("SQL", response.get_json()["message"])
+        self.assertEqual(len(self.client.get(BASE_URL).get_json()), 1)
+
+    def test_bulk_operations_reject_listing_arguments(self):
+        """It should not update or delete in bulk with paging or projection"""
+        self._create_products(3)
+        body = {"ids": [1], "changes": {"price": 1}}
+        for name in ("limit", "cursor", "fields", "stream"):
+            for method in (self.client.delete, self.client.patch):
+                response = method(BASE_URL, query_string={name: "1"}, json=body)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn(name, response.get_json()["message"])
+        self.assertEqual(len(self.client.get(BASE_URL).get_json()), 3)
+
+    def test_data_reset(self):
+        """It should remove all Products"""
+        self._create_products(3)
+        routes.data_reset()
+        self.assertEqual(self.client.get(BASE_URL).get_json(), [])
+
     def test_delete_product(self):
         """It should Delete a Product"""
         # Create a product to be deleted
@@ -333,6 +913,8 @@ class TestProductService(TestCase):
             product for product in products if product.available is True
         ]
         product = available_products[0]
+        response = self.client.get(f"{BASE_URL}/{product.id}")
+        self.assertEqual(response.get_json()["available"], True)
         response = self.client.put(f"{BASE_URL}/{product.id}/purchase")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         response = self.client.get(f"{BASE_URL}/{product.id}")
@@ -383,6 +965,28 @@ class TestSadPaths(TestCase):
         response = self.client.post(BASE_URL)
         self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
 
+    def test_list_bad_cursor(self):
+        """It should not List Products with an invalid cursor"""
+        response = self.client.get(BASE_URL, query_string="cursor=not-a-cursor")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        cursor = routes.encode_cursor(1).replace("aWQ", "eDp")
+        response = self.client.get(BASE_URL, query_string={"cursor": cursor})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # past the range of the id column
+        cursor = routes.encode_cursor(99999999999999999999)
+        response = self.client.get(BASE_URL, query_string={"cursor": cursor})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_bad_stream_format(self):
+        """It should not Stream Products in an unknown format"""
+        response = self.client.get(BASE_URL, query_string="stream=xml")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_bad_limit(self):
+        """It should not List Products with an out of range limit"""
+        response = self.client.get(BASE_URL, query_string="limit=0")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_create_product_wrong_content_type(self):
         """It should not Create a Product with the wrong content type"""
         response = self.client.post(BASE_URL, data="hello", content_type="text/html")